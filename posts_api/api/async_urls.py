@@ -0,0 +1,37 @@
+from django.urls import include, path
+from django.urls.resolvers import URLPattern
+
+from .async_views import async_read_view
+from .urls import router
+
+ASYNC_READ_ROUTES = (
+    'posts-list',
+    'posts-detail',
+    'follow-posts-list',
+    'users-list',
+    'users-detail',
+    'users-typeahead',
+    'posts-export',
+    'follow-posts-export',
+    'follow-posts-stream',
+)
+
+
+def get_async_patterns(patterns):
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_read_view(pattern.callback),
+            pattern.default_args,
+            pattern.name,
+        )
+        if pattern.name in ASYNC_READ_ROUTES else pattern
+        for pattern in patterns
+    ]
+
+
+urlpatterns = [
+    path('v1/auth/', include('djoser.urls')),
+    path('v1/auth/', include('djoser.urls.jwt')),
+    path('v1/', include(get_async_patterns(router.urls))),
+]
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+from rest_framework.permissions import SAFE_METHODS
+
+read_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_READ_WORKERS', 32),
+    thread_name_prefix='async-read',
+)
+
+
+def process_request(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Асинхронный вариант представления DRF для ASGI.
+
+    Django 3.2 не умеет асинхронный ORM, а синхронные представления под
+    ASGI выполняет в одном общем потоке. Чтение поэтому уходит в пул из
+    ASYNC_READ_WORKERS потоков, каждый со своим соединением с базой, и
+    цикл событий не ждет базу. Запросы на запись идут обычным путем.
+    """
+    pooled = sync_to_async(
+        process_request, thread_sensitive=False, executor=read_executor
+    )
+    serial = sync_to_async(view)
+
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await pooled(view, request, *args, **kwargs)
+        return await serial(request, *args, **kwargs)
+
+    wrapper.csrf_exempt = getattr(view, 'csrf_exempt', False)
+    return wrapper
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """Потоковый ответ с асинхронным итератором частей.
+
+    Отдается только StreamingASGIHandler: он перебирает части в цикле
+    событий и закрывает итератор.
+    """
+
+    def __init__(self, parts, *args, **kwargs):
+        super().__init__((), *args, **kwargs)
+        self.parts = parts
+
+    def __aiter__(self):
+        return self.parts.__aiter__()
+
+    def __iter__(self):
+        raise TypeError('Ответ отдается только под ASGI.')
+
+
+async def iterate_in_thread(iterator, close):
+    """Асинхронный перебор синхронного итератора в отдельном потоке.
+
+    Все части и close выполняются в одном потоке, поэтому серверный
+    курсор выгрузки остается на своем соединении с базой. close
+    закрывает ответ, а сигнал request_finished — соединения потока.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix='async-stream'
+    )
+    step = sync_to_async(next, thread_sensitive=False, executor=executor)
+    try:
+        while True:
+            part = await step(iterator, None)
+            if part is None:
+                return
+            yield part
+    finally:
+        await sync_to_async(
+            close, thread_sensitive=False, executor=executor
+        )()
+        executor.shutdown(wait=False)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGIHandler, который не перебирает потоковые ответы в цикле событий.
+
+    Django 3.2 перебирает StreamingHttpResponse прямо в цикле событий:
+    запросы к базе в генераторе падают с SynchronousOnlyOperation, а
+    любое ожидание останавливает все запросы процесса. Здесь каждая
+    часть ответа получается в отдельном потоке этого ответа.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.get_response_headers(response),
+        })
+        if isinstance(response, AsyncStreamingHttpResponse):
+            parts = response.parts
+        else:
+            parts = iterate_in_thread(iter(response), response.close)
+        try:
+            async for part in parts:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send({'type': 'http.response.body'})
+        finally:
+            await parts.aclose()
+
+    def get_response_headers(self, response):
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((
+                b'Set-Cookie',
+                cookie.output(header='').encode('ascii').strip()
+            ))
+        return headers
@@ -0,0 +1,142 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from posts.models import User
+
+
+class UserCache:
+    """LRU-кэш пользователей в памяти процесса с ограниченным сроком.
+
+    Хранит не больше max_size пользователей, каждого не дольше timeout
+    секунд. Выдает копии, чтобы запросы не делили один объект.
+
+    Запись доверяется, только пока совпадает поколение пользователя в
+    общем кэше alias: сброс меняет поколение, и записи в остальных
+    процессах перестают совпадать. Проверка стоит одного cache.get.
+    """
+    key_prefix = 'auth-user'
+
+    def __init__(self, max_size, timeout, alias='default'):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.alias = alias
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+        self.metrics = dict.fromkeys(('hits', 'misses'), 0)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def get_generation(self, user_id):
+        key = self.make_key(user_id)
+        generation = self.cache.get(key)
+        if generation is None:
+            # Потерянное поколение не должно совпасть со старыми записями.
+            generation = uuid.uuid4().hex
+            self.cache.add(key, generation, None)
+            generation = self.cache.get(key, generation)
+        return generation
+
+    def get(self, user_id):
+        """Возвращает пользователя или None и текущее поколение.
+
+        Поколение читается до запроса к базе и передается в set, чтобы
+        сброс во время загрузки не оставил в кэше старые данные.
+        """
+        generation = self.get_generation(user_id)
+        with self.lock:
+            user, expires, cached_generation = self.users.get(
+                user_id, (None, 0, None)
+            )
+            if (user is None or expires <= time.monotonic()
+                    or cached_generation != generation):
+                self.users.pop(user_id, None)
+                self.metrics['misses'] += 1
+                return None, generation
+            self.users.move_to_end(user_id)
+            self.metrics['hits'] += 1
+        return copy.copy(user), generation
+
+    def set(self, user_id, user, generation):
+        with self.lock:
+            self.users[user_id] = (
+                copy.copy(user), time.monotonic() + self.timeout, generation
+            )
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids):
+        """Сбрасывает пользователей во всех процессах.
+
+        queryset.update не вызывает сигналов, поэтому массовые изменения
+        пользователей должны вызывать этот метод сами.
+        """
+        self.cache.set_many({
+            self.make_key(user_id): uuid.uuid4().hex for user_id in user_ids
+        }, None)
+        with self.lock:
+            for user_id in user_ids:
+                self.users.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.metrics, size=len(self.users))
+
+
+user_cache = UserCache(
+    getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000),
+    getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 30),
+    getattr(settings, 'POSTS_CACHE_ALIAS', 'default'),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication без запроса пользователя к базе на каждый запрос.
+
+    Подпись и срок токена проверяются как обычно, пользователь берется
+    из user_cache по номеру из токена. Изменение или удаление
+    пользователя после фиксации сбрасывает его во всех процессах,
+    если кэш alias общий (Redis, memcached). На кэше в памяти процесса
+    остальные процессы видят изменение через AUTH_USER_CACHE_TIMEOUT
+    секунд.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        user, generation = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, generation)
+        return user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed_handler(sender, instance, **kwargs):
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
@@ -0,0 +1,243 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from posts.models import Follow, Post, ReadStatus, User
+from posts.signals import (follows_bulk_created, posts_bulk_created,
+                           read_marks_buffered, read_status_changed)
+
+from .serializers import (POST_VALUES, PostSerializers,
+                          post_values_to_representation)
+
+
+class PostBodyCache:
+    """Кэш сериализованных постов без персонального read_status.
+
+    Тела постов общие для всех пользователей, read_status накладывается
+    поверх при каждом ответе. Записи сбрасываются после фиксации
+    сохранения и удаления постов и смены имени автора. Для нескольких
+    процессов нужен общий бэкенд (Redis, memcached), иначе процессы
+    увидят разные данные.
+    """
+    key_prefix = 'post-body'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.metrics = {
+            'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0
+        }
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, post_id):
+        return f'{self.key_prefix}:{post_id}'
+
+    def count(self, metric, value=1):
+        if value:
+            with self.lock:
+                self.metrics[metric] += value
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.metrics)
+
+    def get_many(self, post_ids):
+        keys = {self.make_key(post_id): post_id for post_id in post_ids}
+        found = self.cache.get_many(list(keys))
+        self.count('hits', len(found))
+        self.count('misses', len(keys) - len(found))
+        return {keys[key]: body for key, body in found.items()}
+
+    def set_many(self, bodies):
+        self.cache.set_many(
+            {self.make_key(post_id): body for post_id, body in bodies.items()},
+            self.timeout
+        )
+        self.count('sets', len(bodies))
+
+    def invalidate(self, post_ids):
+        self.cache.delete_many([self.make_key(pk) for pk in post_ids])
+        self.count('invalidations', len(post_ids))
+
+    def get_bodies(self, post_ids):
+        bodies = self.get_many(post_ids)
+        missing = [post_id for post_id in post_ids if post_id not in bodies]
+        if missing:
+            # Промахи читаются с основной базы: тело с отстающей реплики
+            # осталось бы в кэше до истечения срока.
+            fresh = self.serialize_values(Post.objects.using(
+                DEFAULT_DB_ALIAS
+            ).filter(pk__in=missing).values(*POST_VALUES))
+            self.set_many(fresh)
+            bodies.update(fresh)
+        return bodies
+
+    def serialize(self, posts):
+        return {
+            post.pk: dict(PostSerializers(post).data) for post in posts
+        }
+
+    def serialize_values(self, rows):
+        return {
+            row['id']: post_values_to_representation(row) for row in rows
+        }
+
+
+class VersionStore:
+    """Время последнего изменения наборов данных для условных GET.
+
+    Отсутствующая в кэше версия считается изменившейся только что, поэтому
+    потеря кэша приводит к лишнему 200, но не к устаревшему 304.
+    Версии в памяти процесса не видят изменений из других процессов,
+    поэтому на таком бэкенде условные GET отключены. shared=None
+    определяет общий бэкенд по его классу. conditional=True требует
+    условных GET и не дает запуститься на кэше в памяти процесса,
+    conditional=False выключает их.
+    """
+    key_prefix = 'version'
+    local_backends = (DummyCache, LocMemCache)
+
+    def __init__(self, alias, shared=None, conditional=None):
+        self.alias = alias
+        self.shared = shared
+        self.conditional = conditional
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def is_shared(self):
+        if self.shared is not None:
+            return self.shared
+        return not isinstance(self.cache, self.local_backends)
+
+    def is_conditional(self):
+        return self.conditional is not False and self.is_shared()
+
+    def check_backend(self):
+        if self.conditional and not self.is_shared():
+            raise ImproperlyConfigured(
+                f'Условные GET требуют общего кэша, а кэш {self.alias!r} '
+                'хранится в памяти процесса. Задайте CACHE_BACKEND '
+                '(Redis, memcached, DatabaseCache) или выключите '
+                'POSTS_CONDITIONAL_GET.'
+            )
+
+    def make_key(self, name):
+        return f'{self.key_prefix}:{name}'
+
+    def get_many(self, names):
+        keys = [self.make_key(name) for name in names]
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                now = time.time()
+                self.cache.add(key, now, None)
+                found[key] = self.cache.get(key, now)
+        return [found[key] for key in keys]
+
+    def bump(self, *names):
+        now = time.time()
+        self.cache.set_many(
+            {self.make_key(name): now for name in names}, None
+        )
+
+
+post_cache = PostBodyCache(
+    getattr(settings, 'POSTS_CACHE_ALIAS', 'default'),
+    getattr(settings, 'POSTS_CACHE_TIMEOUT', 300),
+)
+
+versions = VersionStore(
+    getattr(settings, 'POSTS_CACHE_ALIAS', 'default'),
+    getattr(settings, 'POSTS_CACHE_SHARED', None),
+    getattr(settings, 'POSTS_CONDITIONAL_GET', None),
+)
+
+
+@checks.register(checks.Tags.caches)
+def conditional_get_check(app_configs, **kwargs):
+    if versions.conditional is None and not versions.is_shared():
+        return [checks.Warning(
+            'Условные GET (ETag, 304) отключены: кэш '
+            f'{versions.alias!r} хранится в памяти процесса.',
+            hint='Задайте общий CACHE_BACKEND или POSTS_CONDITIONAL_GET '
+                 '= False, чтобы убрать предупреждение.',
+            id='api.W001',
+        )]
+    return []
+
+
+def after_commit(func, *args):
+    # До фиксации другой запрос прочитал бы старые данные и снова
+    # положил их в кэш уже после сброса.
+    transaction.on_commit(lambda: func(*args))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed_handler(sender, instance, **kwargs):
+    after_commit(post_cache.invalidate, [instance.pk])
+    after_commit(versions.bump, 'posts', 'users')
+
+
+@receiver(pre_save, sender=User)
+def author_saving_handler(sender, instance, using, update_fields=None,
+                          **kwargs):
+    # Сохранения без смены имени (например, last_login) кэш не трогают.
+    changed = instance.pk is not None and (
+        update_fields is None or 'username' in update_fields
+    )
+    if changed:
+        changed = not sender.objects.using(using).filter(
+            pk=instance.pk, username=instance.username
+        ).exists()
+    instance._username_changed = changed
+
+
+@receiver(post_save, sender=User)
+def author_changed_handler(sender, instance, created, **kwargs):
+    if created:
+        after_commit(versions.bump, 'users')
+        return
+    if not getattr(instance, '_username_changed', True):
+        return
+    after_commit(post_cache.invalidate, list(
+        instance.posts.values_list('pk', flat=True)
+    ))
+    after_commit(versions.bump, 'posts', 'users')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed_handler(sender, instance, **kwargs):
+    after_commit(versions.bump, f'follows:{instance.user_id}')
+
+
+@receiver(read_marks_buffered, sender=ReadStatus)
+@receiver(read_status_changed, sender=ReadStatus)
+def read_status_changed_handler(sender, user, **kwargs):
+    after_commit(versions.bump, f'reads:{user.pk}')
+
+
+@receiver(posts_bulk_created, sender=Post)
+def posts_bulk_created_handler(sender, **kwargs):
+    after_commit(versions.bump, 'posts', 'users')
+
+
+@receiver(follows_bulk_created, sender=Follow)
+def follows_bulk_created_handler(sender, user_id, **kwargs):
+    after_commit(versions.bump, f'follows:{user_id}')
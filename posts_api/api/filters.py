@@ -0,0 +1,35 @@
+from rest_framework.filters import SearchFilter
+
+from posts.search import SEARCH_ORDERING, search_posts
+from posts.user_search import username_index
+
+
+class PostSearchFilter(SearchFilter):
+    """Полнотекстовый поиск по заголовку и тексту постов вместо ILIKE."""
+
+    def get_search_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def get_keyset_ordering(self, request):
+        if self.get_search_query(request):
+            return SEARCH_ORDERING
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        return search_posts(queryset, query)
+
+
+class UsernameSearchFilter(SearchFilter):
+    """Поиск пользователей по подстроке имени через username_index."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        field = getattr(view, 'username_search_field', 'pk')
+        return queryset.filter(
+            **{f'{field}__in': username_index.search(query)}
+        )
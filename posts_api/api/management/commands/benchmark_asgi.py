@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения под WSGI и ASGI '
+        'при конкурентных запросах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--wsgi-workers', type=int, default=None,
+            help='Число потоков WSGI, по умолчанию равно --concurrency.'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.first()
+        if user is None:
+            raise CommandError('Для замера нужен хотя бы один пользователь.')
+        token = f'Bearer {AccessToken.for_user(user)}'
+        paths = [
+            f'{reverse("posts-list")}?limit=20',
+            f'{reverse("follow-posts-list")}?limit=20',
+            f'{reverse("users-list")}?limit=20',
+        ]
+        urls = [
+            paths[number % len(paths)]
+            for number in range(options['requests'])
+        ]
+        workers = options['wsgi_workers'] or options['concurrency']
+        # Тестовые клиенты обращаются к хосту testserver.
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            wsgi = self.run_wsgi(urls, token, workers)
+            asgi = asyncio.run(
+                self.run_asgi(urls, token, options['concurrency'])
+            )
+        self.stdout.write(
+            f'WSGI, потоков {workers}: {wsgi:.1f} запросов/с'
+        )
+        self.stdout.write(
+            f'ASGI, конкурентность {options["concurrency"]}, потоков чтения '
+            f'{settings.ASYNC_READ_WORKERS}: {asgi:.1f} запросов/с'
+        )
+        self.stdout.write(self.style.SUCCESS(f'ASGI/WSGI: x{asgi / wsgi:.2f}'))
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise CommandError(
+                f'Запрос завершился с кодом {response.status_code}.'
+            )
+
+    def run_wsgi(self, urls, token, workers):
+        local = threading.local()
+
+        def get(url):
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_AUTHORIZATION=token)
+            self.check_response(local.client.get(url))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            list(executor.map(get, urls))
+            return len(urls) / (time.perf_counter() - start)
+
+    async def run_asgi(self, urls, token, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get(url):
+            async with semaphore:
+                response = await client.get(url, authorization=token)
+            self.check_response(response)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(get(url) for url in urls))
+        return len(urls) / (time.perf_counter() - start)
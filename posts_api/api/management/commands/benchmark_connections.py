@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает накладные расходы на соединение с базой за запрос: '
+        'новое соединение, постоянное соединение и пул.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        modes = {
+            'новое соединение': {'CONN_MAX_AGE': 0},
+            'постоянное соединение': {'CONN_MAX_AGE': None},
+        }
+        if hasattr(connection, 'get_pool_stats'):
+            modes['пул'] = {'CONN_MAX_AGE': 0, 'POOL': {'max_size': 1}}
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Бэкенд {connection.vendor} не поддерживает пул.'
+            ))
+        results = {
+            name: self.measure(overrides, options['requests'])
+            for name, overrides in modes.items()
+        }
+        baseline = results['новое соединение']
+        for name, duration in results.items():
+            self.stdout.write(
+                f'{name}: {duration:.3f} мс на запрос, '
+                f'экономия {baseline - duration:.3f} мс'
+            )
+
+    def measure(self, overrides, number):
+        """Среднее время цикла запроса с одним SELECT 1 в миллисекундах."""
+        saved = connection.settings_dict.copy()
+        connection.close()
+        connection.settings_dict.update(overrides)
+        try:
+            self.run_request()
+            start = time.perf_counter()
+            for _ in range(number):
+                self.run_request()
+            return (time.perf_counter() - start) / number * 1000
+        finally:
+            connection.close()
+            if hasattr(connection, 'close_pools'):
+                connection.close_pools()
+            connection.settings_dict.clear()
+            connection.settings_dict.update(saved)
+
+    def run_request(self):
+        # Сигналы запроса закрывают устаревшие соединения, как и обработчик
+        # WSGI и ASGI.
+        request_started.send(sender=self.__class__)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        request_finished.send(sender=self.__class__)
@@ -0,0 +1,71 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import renderers
+from api.views import PostViewSet
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время ответа списка постов со стандартным '
+        'и быстрым JSON-рендерером.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--host', default='localhost')
+
+    def handle(self, *args, **options):
+        user = User.objects.first()
+        if user is None or not Post.objects.exists():
+            raise CommandError('Для замера нужны пользователи и посты.')
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен, быстрый рендерер использует json.'
+            ))
+        factory = APIRequestFactory()
+        results = {}
+        for renderer_class in (JSONRenderer, renderers.FastJSONRenderer):
+            view = PostViewSet.as_view(
+                {'get': 'list'},
+                basename='posts',
+                renderer_classes=[renderer_class]
+            )
+
+            def get_page():
+                request = factory.get(
+                    '/api/v1/posts/',
+                    {'limit': options['limit']},
+                    SERVER_NAME=options['host']
+                )
+                force_authenticate(request, user=user)
+                return view(request).render()
+
+            data = get_page().data
+            renderer = renderer_class()
+            number = options['iterations']
+            results[renderer_class.__name__] = (
+                self.measure(get_page, number),
+                self.measure(lambda: renderer.render(data), number),
+            )
+        for name, (request_time, render_time) in results.items():
+            self.stdout.write(
+                f'{name}: запрос {request_time:.3f} мс, '
+                f'рендер {render_time:.3f} мс'
+            )
+        stock, fast = results.values()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: запрос x{stock[0] / fast[0]:.2f}, '
+            f'рендер x{stock[1] / fast[1]:.2f}'
+        ))
+
+    def measure(self, function, number):
+        """Лучшее из трех время одного вызова в миллисекундах."""
+        return min(timeit.repeat(function, number=number, repeat=3)) / (
+            number / 1000
+        )
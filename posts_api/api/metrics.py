@@ -0,0 +1,146 @@
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET = getattr(settings, 'API_QUERY_BUDGET', 20)
+
+# Время этапов и число запросов к базе в ответе помогают подобрать
+# нагрузку на медленные запросы, поэтому по умолчанию только в DEBUG.
+SERVER_TIMING = getattr(settings, 'API_SERVER_TIMING', settings.DEBUG)
+
+TIME_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+request_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Запросы к базе и время этапов одного HTTP-запроса в секундах."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view = None
+        self.query_budget = QUERY_BUDGET
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+
+    def get_total(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db * 1000:.3f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.3f}',
+            f'render;dur={self.render * 1000:.3f}',
+            f'total;dur={total * 1000:.3f}',
+        ])
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = {}
+
+    def observe(self, labels, value):
+        counts, total = self.counts.get(labels, (None, 0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.counts[labels] = (counts, total + value)
+
+    def expose(self, name, help_text):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, *labels), (counts, total) in sorted(self.counts.items()):
+            label = f'view="{view}"' + ''.join(
+                f',stage="{stage}"' for stage in labels
+            )
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{name}_sum{{{label}}} {total}')
+            lines.append(f'{name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Гистограммы по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = Histogram(TIME_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+
+    def observe(self, metrics, total):
+        view = metrics.view or 'unresolved'
+        with self.lock:
+            self.queries.observe((view,), metrics.queries)
+            for stage, value in (
+                ('db', metrics.db),
+                ('serialize', metrics.serialize),
+                ('render', metrics.render),
+                ('total', total),
+            ):
+                self.durations.observe((view, stage), value)
+
+    def expose(self):
+        with self.lock:
+            lines = [
+                *self.durations.expose(
+                    'api_request_duration_seconds',
+                    'Время этапов обработки запроса.'
+                ),
+                *self.queries.expose(
+                    'api_request_queries', 'Число запросов к базе.'
+                ),
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db += time.perf_counter() - start
+
+
+def finish_request(metrics, response):
+    total = metrics.get_total()
+    if SERVER_TIMING:
+        response['Server-Timing'] = metrics.server_timing(total)
+    registry.observe(metrics, total)
+    budget = metrics.query_budget
+    if budget is not None and metrics.queries > budget:
+        logger.warning(
+            '%s: %d запросов к базе при бюджете %d.',
+            metrics.view, metrics.queries, budget
+        )
+
+
+@receiver(connection_created)
+def connection_created_handler(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
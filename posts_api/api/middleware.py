@@ -0,0 +1,56 @@
+import asyncio
+
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import RequestMetrics, finish_request, request_metrics
+
+
+@sync_and_async_middleware
+def asgi_urlconf_middleware(get_response):
+    """Под ASGI разрешает адреса по ASGI_URLCONF."""
+    if not asyncio.iscoroutinefunction(get_response):
+        return get_response
+
+    async def middleware(request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await get_response(request)
+
+    return middleware
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    name = match.view_name if match is not None else 'unresolved'
+    return f'{request.method} {name}'
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Считает запросы к базе и время этапов обработки каждого запроса.
+
+    Итог копится в гистограммах для /metrics и при API_SERVER_TIMING
+    отдается в заголовке Server-Timing.
+    """
+    def start():
+        metrics = RequestMetrics()
+        return metrics, request_metrics.set(metrics)
+
+    def finish(request, response, metrics, token):
+        request_metrics.reset(token)
+        metrics.view = get_view_name(request)
+        finish_request(metrics, response)
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics, token = start()
+            response = await get_response(request)
+            return finish(request, response, metrics, token)
+    else:
+        def middleware(request):
+            metrics, token = start()
+            response = get_response(request)
+            return finish(request, response, metrics, token)
+
+    return middleware
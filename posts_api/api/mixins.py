@@ -1,4 +1,27 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from posts.models import Post
+from posts.read_buffer import read_buffer
+from posts.read_tracking import (annotate_read_status, attach_read_status,
+                                 read_post_ids)
+from posts.routers import replica_may_lag, start_routing, stop_routing
+
+from .cache import post_cache, versions
+from .filters import PostSearchFilter
+from .metrics import request_metrics
+from .renderers import FastJSONRenderer
+from .serializers import POST_VALUES, post_values_to_representation
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'POSTS_EXPORT_CHUNK_SIZE', 2000)
 
 
 class ListViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
@@ -7,3 +30,228 @@ class ListViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
 class ListCreateViewSet(mixins.CreateModelMixin, ListViewSet):
     pass
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """Условные GET по ETag и Last-Modified для чтения списков и объектов.
+
+    Валидаторы строятся из версий наборов данных в кэше, поэтому 304
+    возвращается до выполнения запросов к базе и сериализации. Действия
+    с побочными эффектами в conditional_actions не включаются.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_validator_keys(self):
+        return ()
+
+    def get_validators(self, request):
+        keys = self.get_validator_keys()
+        timestamps = versions.get_many(keys)
+        source = '|'.join([
+            self.basename,
+            self.action,
+            str(request.user.pk),
+            request.get_full_path(),
+            *(f'{key}={timestamp!r}' for key, timestamp in zip(
+                keys, timestamps
+            )),
+        ])
+        etag = hashlib.md5(source.encode()).hexdigest()
+        return quote_etag(etag), int(max(timestamps, default=0)) + 1
+
+    def is_conditional(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and self.action in self.conditional_actions
+            and versions.is_conditional()
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not self.is_conditional(request):
+            return
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            self.set_validators(response, etag, last_modified)
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.is_conditional(request) and response.status_code == 200:
+            etag, last_modified = self.get_validators(request)
+            # Ответ со свежим валидатором, но данными с отстающей реплики
+            # клиент закэшировал бы надолго.
+            if not replica_may_lag(last_modified):
+                self.set_validators(response, etag, last_modified)
+        return response
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization', ))
+
+
+class InstrumentedViewMixin:
+    """Время обработчика и рендеринга для metrics_middleware.
+
+    Время обработчика без запросов к базе считается временем
+    сериализации: остальной код представлений почти ничего не стоит.
+    query_budget переопределяет API_QUERY_BUDGET для представления.
+    """
+    query_budget = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = request_metrics.get()
+        if metrics is not None:
+            if self.query_budget is not None:
+                metrics.query_budget = self.query_budget
+            self.handler_start = time.perf_counter(), metrics.db
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        metrics = request_metrics.get()
+        if metrics is None:
+            return response
+        if getattr(self, 'handler_start', None) is not None:
+            start, db = self.handler_start
+            metrics.serialize += (
+                time.perf_counter() - start - (metrics.db - db)
+            )
+        if getattr(response, 'is_rendered', True):
+            return response
+        render_start = time.perf_counter()
+
+        def rendered(response):
+            metrics.render += time.perf_counter() - render_start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaReadMixin:
+    """Чтение с реплик в GET-запросах действий из replica_actions.
+
+    Запись в остальных запросах закрепляет пользователя за основной
+    базой, чтобы следующие чтения видели его изменения.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.routing_token = start_routing(
+            request.user,
+            request.method in ('GET', 'HEAD')
+            and self.action in self.replica_actions
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        token = getattr(self, 'routing_token', None)
+        if token is not None:
+            self.routing_token = None
+            stop_routing(token)
+        return response
+
+
+class PostQuerysetMixin:
+    """Единый план запроса для эндпоинтов с постами.
+
+    Список выбирает из базы только ключи страницы, тела постов берутся из
+    кэша, промахи догружаются одним запросом .values() с автором через
+    JOIN и собираются без сериализатора.
+    Статус прочтения проставляется одним поиском по всем постам страницы,
+    поэтому число запросов на страницу не зависит от её размера.
+    """
+    filter_backends = (PostSearchFilter, )
+    keyset_ordering = ('-pub_date', '-id')
+
+    def get_keyset_ordering(self, request):
+        return (
+            PostSearchFilter().get_keyset_ordering(request)
+            or self.keyset_ordering
+        )
+
+    def get_base_queryset(self):
+        return Post.objects.all()
+
+    def get_queryset(self):
+        return self.get_base_queryset().select_related('author')
+
+    def get_serializer(self, instance=None, *args, **kwargs):
+        if instance is not None:
+            posts = instance if kwargs.get('many') else [instance]
+            attach_read_status(self.request.user, list(posts))
+        return super().get_serializer(instance, *args, **kwargs)
+
+    def get_list_queryset(self):
+        return self.get_base_queryset().values('id', 'pub_date')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_list_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = self.get_post_bodies([row['id'] for row in rows])
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def get_post_bodies(self, post_ids):
+        bodies = post_cache.get_bodies(post_ids)
+        read_ids = read_post_ids(self.request.user, post_ids)
+        return [
+            dict(bodies[post_id], read_status=post_id in read_ids)
+            for post_id in post_ids
+            if post_id in bodies
+        ]
+
+    @action(detail=False)
+    def export(self, request):
+        """Выгрузка всех постов в NDJSON, по одному посту на строку.
+
+        Посты, автор и read_status читаются одним запросом через
+        серверный курсор, поэтому выгрузка видит один снимок данных, а
+        память ограничена размером пачки. Отложенные отметки о прочтении
+        записываются до выгрузки, чтобы read_status их учитывал.
+        """
+        read_buffer.flush()
+        rows = annotate_read_status(
+            request.user, self.filter_queryset(self.get_base_queryset())
+        ).values(*POST_VALUES, 'read_status').order_by('id')
+        response = StreamingHttpResponse(
+            self.stream_rows(rows), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.basename}.ndjson"'
+        )
+        return response
+
+    def stream_rows(self, rows):
+        renderer = FastJSONRenderer()
+        lines = []
+        for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            lines.append(renderer.render(post_values_to_representation(row)))
+            if len(lines) == EXPORT_CHUNK_SIZE:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
@@ -0,0 +1,234 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def rename_field(field, names):
+    name = field.lstrip('-')
+    return field[:len(field) - len(name)] + names.get(name, name)
+
+
+class KeysetUnion:
+    """UNION запросов .values() с общим ключом сортировки.
+
+    parts — пары (queryset, names), names переводит имена полей ключа в
+    поля этого запроса. Сортировка, условие курсора и LIMIT применяются
+    к каждому запросу до объединения, поэтому каждый читает не больше
+    страницы по своему индексу. Строки получают имена полей первого
+    запроса, одинаковые строки схлопываются.
+    """
+
+    def __init__(self, parts, ordering):
+        self.ordering = ordering
+        self.parts = [
+            (queryset.order_by(*(
+                rename_field(field, names) for field in ordering
+            )), names)
+            for queryset, names in parts
+        ]
+
+    def order_by(self, *ordering):
+        return KeysetUnion(self.parts, ordering)
+
+    def filter_keyset(self, get_filter):
+        return KeysetUnion([
+            (queryset.filter(get_filter(names)), names)
+            for queryset, names in self.parts
+        ], self.ordering)
+
+    def get_union(self, limit=None):
+        querysets = []
+        for queryset, _ in self.parts:
+            # SQLite не допускает ORDER BY и LIMIT в частях UNION.
+            features = connections[queryset.db].features
+            if (
+                limit is not None
+                and features.supports_slicing_ordering_in_compound
+            ):
+                queryset = queryset[:limit]
+            else:
+                queryset = queryset.order_by()
+            querysets.append(queryset)
+        return querysets[0].union(*querysets[1:]).order_by(*self.ordering)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.get_union(key.stop)[key]
+        return self.get_union(key + 1)[key]
+
+    def __iter__(self):
+        return iter(self.get_union())
+
+    def count(self):
+        return self.get_union().count()
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """LimitOffsetPagination с дополнительным режимом курсора.
+
+    Режим включается параметром ?cursor= (пустое значение для первой
+    страницы). Страница выбирается условием по ключу сортировки вида
+    (pub_date, id) < (последние значения), поэтому порядок стабилен при
+    конкурентных вставках и COUNT(*) не выполняется.
+    """
+    cursor_query_param = 'cursor'
+    cursor_default_limit = 100
+    max_limit = 1000
+    default_keyset_ordering = ('-id',)
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request) or self.cursor_default_limit
+        self.ordering = self.get_keyset_ordering(request, view)
+        cursor = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        queryset = queryset.order_by(*self.ordering)
+        if cursor is not None:
+            queryset = self.filter_keyset(queryset, cursor)
+        page = list(queryset[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+        self.page = page[:self.limit]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        last = self.page[-1]
+        values = [
+            last[name] if isinstance(last, dict) else getattr(last, name)
+            for name in (field.lstrip('-') for field in self.ordering)
+        ]
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(values)
+        )
+
+    def get_keyset_ordering(self, request, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return view.get_keyset_ordering(request)
+        return getattr(
+            view, 'keyset_ordering', self.default_keyset_ordering
+        )
+
+    def filter_keyset(self, queryset, values):
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        union = isinstance(queryset, KeysetUnion)
+        sample = queryset.parts[0][0] if union else queryset
+        values = self.clean_cursor(sample, values)
+        nulls_largest = connections[sample.db].features.nulls_order_largest
+        # Для каждого поля ключа: None, если NULL в нем не бывает, иначе
+        # сортирует ли база NULL после остальных значений.
+        self.nulls = [
+            nulls_largest if self.is_nullable(sample, field) else None
+            for field in self.ordering
+        ]
+        if union:
+            return queryset.filter_keyset(
+                lambda names: self.get_keyset_filter(values, names)
+            )
+        return queryset.filter(self.get_keyset_filter(values))
+
+    def get_cursor_field(self, queryset, field):
+        name = field.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def is_nullable(self, queryset, field):
+        # Аннотации берутся через LEFT JOIN и могут быть NULL.
+        return (
+            field.lstrip('-') in queryset.query.annotations
+            or self.get_cursor_field(queryset, field).null
+        )
+
+    def clean_cursor(self, queryset, values):
+        """Приводит значения курсора к типам полей ключа сортировки."""
+        cleaned = []
+        for field, value in zip(self.ordering, values):
+            if value is None:
+                if not self.is_nullable(queryset, field):
+                    raise NotFound(self.invalid_cursor_message)
+                cleaned.append(None)
+                continue
+            if isinstance(value, (dict, list)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(
+                    self.get_cursor_field(queryset, field).to_python(value)
+                )
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def get_keyset_filter(self, values, names=None):
+        keyset_filter = Q(pk__in=[])
+        equal = Q()
+        for field, value, nulls_largest in zip(
+            self.ordering, values, self.nulls
+        ):
+            name = rename_field(field, names or {}).lstrip('-')
+            ascending = not field.startswith('-')
+            if value is None:
+                # Дальше идут значения, если NULL стоит в начале порядка.
+                after = (
+                    Q(**{f'{name}__isnull': False})
+                    if ascending != nulls_largest else None
+                )
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                lookup = 'gt' if ascending else 'lt'
+                after = Q(**{f'{name}__{lookup}': value})
+                if nulls_largest is not None and ascending == nulls_largest:
+                    after |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            if after is not None:
+                keyset_filter |= equal & after
+            equal &= same
+        return keyset_filter
+
+    def encode_cursor(self, values):
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+        data = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values
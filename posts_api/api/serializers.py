@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.relations import SlugRelatedField
@@ -5,6 +6,10 @@ from rest_framework.validators import UniqueTogetherValidator
 
 from posts.models import Follow, Post, User
 
+BULK_LIMIT = getattr(settings, 'POSTS_BULK_LIMIT', 5000)
+
+STREAM_TIMEOUT = getattr(settings, 'POSTS_STREAM_TIMEOUT', 25)
+
 
 class PostSerializers(serializers.ModelSerializer):
     author = SlugRelatedField(
@@ -15,7 +20,7 @@ class PostSerializers(serializers.ModelSerializer):
 
     class Meta:
         model = Post
-        fields = '__all__'
+        exclude = ('search_vector', )
 
 
 class FollowSerializers(serializers.ModelSerializer):
@@ -45,6 +50,83 @@ class FollowSerializers(serializers.ModelSerializer):
         return data
 
 
+class StreamSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, required=False)
+    timeout = serializers.FloatField(
+        min_value=0, max_value=60, default=STREAM_TIMEOUT
+    )
+
+
+class SyncSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+
+
+class BulkSerializer(serializers.Serializer):
+    items = serializers.ListField(
+        child=serializers.DictField(), min_length=1, max_length=BULK_LIMIT
+    )
+
+
+class BulkPostSerializer(BulkSerializer):
+    def validate_posts(self):
+        posts, errors = [], []
+        for index, item in enumerate(self.validated_data['items']):
+            serializer = PostSerializers(data=item)
+            if serializer.is_valid():
+                posts.append(Post(**serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        return posts, errors
+
+
+class BulkFollowSerializer(BulkSerializer):
+    """Проверки FollowSerializers для пачки подписок.
+
+    Существование авторов и уже оформленные подписки проверяются двумя
+    запросами на всю пачку, а не запросом на каждую подписку.
+    """
+
+    def validate_follows(self, user):
+        items = self.validated_data['items']
+        messages = FollowSerializers().fields['following'].error_messages
+        unique_message = UniqueTogetherValidator.message.format(
+            field_names='user, following'
+        )
+        names = {
+            item['following'] for item in items
+            if isinstance(item.get('following'), str)
+        }
+        authors = {
+            author.username: author
+            for author in User.objects.filter(username__in=names).only(
+                'id', 'username'
+            )
+        }
+        followed = set(Follow.objects.filter(
+            user=user, following__in=authors.values()
+        ).values_list('following_id', flat=True))
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            name = item.get('following')
+            author = authors.get(name) if isinstance(name, str) else None
+            if name is None:
+                error = {'following': [messages['required']]}
+            elif author is None:
+                error = {'following': [messages['does_not_exist'].format(
+                    slug_name='username', value=name
+                )]}
+            elif author.pk == user.pk:
+                error = {'non_field_errors': ['Подписка на себя невозможна!']}
+            elif author.pk in followed:
+                error = {'non_field_errors': [unique_message]}
+            else:
+                followed.add(author.pk)
+                valid.append(author)
+                continue
+            errors.append({'index': index, 'errors': error})
+        return valid, errors
+
+
 class UserSerializer(serializers.ModelSerializer):
     posts_count = serializers.IntegerField(read_only=True)
 
@@ -52,3 +134,60 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'username', 'posts_count')
         ref_name = 'username'
+
+
+class ReadMarksSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=1000,
+        required=False
+    )
+    up_to = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if ('ids' in data) == ('up_to' in data):
+            raise ValidationError(
+                detail='Передайте либо список ids, либо up_to.'
+            )
+        return data
+
+
+class UnreadMarksSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=1000
+    )
+
+
+class TypeaheadSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=150, trim_whitespace=True)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+# Быстрый путь для списков: строки .values() переводятся в словари
+# напрямую, минуя поля сериализаторов. Ключи, их порядок и формат значений
+# совпадают с PostSerializers и UserSerializer, что проверяется тестом.
+POST_VALUES = ('id', 'author__username', 'title', 'text', 'pub_date')
+
+USER_VALUES = ('id', 'username', 'posts_count')
+
+datetime_to_representation = serializers.DateTimeField().to_representation
+
+
+def post_values_to_representation(row):
+    return {
+        'id': row['id'],
+        'author': row['author__username'],
+        'read_status': row.get('read_status', True),
+        'title': row['title'],
+        'text': row['text'],
+        'pub_date': datetime_to_representation(row['pub_date']),
+    }
+
+
+def user_values_to_representation(row):
+    return {
+        'id': row['id'],
+        'username': row['username'],
+        'posts_count': row['posts_count'],
+    }
@@ -0,0 +1,218 @@
+import json
+import threading
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import AsyncClient, RequestFactory, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from posts.models import Follow, Post
+from posts.pubsub import LocalBroker, broker
+from posts.read_buffer import read_buffer
+
+from .. import async_views
+
+User = get_user_model()
+
+
+class AsyncReadTests(TransactionTestCase):
+    async def asgi_get(self, url, query=b'', headers=()):
+        """GET через StreamingASGIHandler, как у сервера ASGI."""
+        communicator = ApplicationCommunicator(
+            async_views.StreamingASGIHandler(), {
+                'type': 'http',
+                'method': 'GET',
+                'path': url,
+                'query_string': query,
+                'server': ('testserver', 80),
+                'headers': [
+                    (b'authorization', self.token.encode()), *headers
+                ],
+            }
+        )
+        await communicator.send_input({'type': 'http.request'})
+        return communicator
+
+    async def receive_response(self, communicator):
+        start = await communicator.receive_output(5)
+        body = []
+        while True:
+            message = await communicator.receive_output(5)
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        await communicator.wait(5)
+        return start, b''.join(body)
+
+    def setUp(self):
+        cache.clear()
+        # Отложенные сигналы должны уйти, пока данные теста не удалены.
+        self.addCleanup(read_buffer.flush)
+        self.user = User.objects.create_user(username='Reader')
+        author = User.objects.create_user(username='Author')
+        Follow.objects.create(user=self.user, following=author)
+        self.post = Post.objects.create(
+            title='title', text='text', author=author
+        )
+        self.token = f'Bearer {AccessToken.for_user(self.user)}'
+        self.sync_client = APIClient()
+        self.sync_client.credentials(HTTP_AUTHORIZATION=self.token)
+
+    async def test_read_endpoints_under_asgi(self):
+        """Под ASGI чтение идет в пуле потоков и совпадает с WSGI."""
+        client = AsyncClient()
+        urls = [
+            reverse('posts-list'),
+            reverse('follow-posts-list'),
+            reverse('users-list'),
+            reverse('users-detail', kwargs={'pk': self.user.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = await client.get(url, authorization=self.token)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    response.asgi_request.urlconf, settings.ASGI_URLCONF
+                )
+                expected = await sync_to_async(self.sync_client.get)(url)
+                self.assertEqual(response.content, expected.content)
+
+    async def test_detail_and_writes_under_asgi(self):
+        """Под ASGI работают просмотр поста и запись."""
+        client = AsyncClient()
+        response = await client.get(
+            reverse('posts-detail', kwargs={'pk': self.post.pk}),
+            authorization=self.token
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await client.post(
+            reverse('posts-list'),
+            {'title': 'new', 'text': 'new'},
+            content_type='application/json',
+            authorization=self.token
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_only_reads_use_thread_pool(self):
+        """В пуле потоков выполняется только чтение."""
+        threads = []
+
+        def view(request):
+            threads.append(threading.current_thread().name)
+
+        async_view = async_to_sync(async_views.async_read_view(view))
+        async_view(RequestFactory().get('/'))
+        async_view(RequestFactory().post('/'))
+        self.assertTrue(threads[0].startswith('async-read'))
+        self.assertFalse(threads[1].startswith('async-read'))
+
+    def get_export(self, url):
+        response = self.sync_client.get(url)
+        return b''.join(response.streaming_content)
+
+    async def test_export_under_asgi(self):
+        """Под ASGI выгрузка читает базу вне цикла событий."""
+        await sync_to_async(Post.objects.create)(
+            title='second', text='text', author=self.post.author
+        )
+        for url in (reverse('posts-export'), reverse('follow-posts-export')):
+            with self.subTest(url=url):
+                start, body = await self.receive_response(
+                    await self.asgi_get(url)
+                )
+                self.assertEqual(start['status'], status.HTTP_200_OK)
+                lines = body.decode().splitlines()
+                self.assertEqual(len(lines), 2)
+                self.assertEqual(json.loads(lines[0])['id'], self.post.pk)
+                expected = await sync_to_async(self.get_export)(url)
+                self.assertEqual(body, expected)
+
+    def test_stream_parts_are_made_in_one_thread(self):
+        """Части ответа и его закрытие выполняются в одном потоке."""
+        threads = []
+
+        def parts():
+            for part in (b'a', b'b'):
+                threads.append(threading.current_thread())
+                yield part
+
+        def close():
+            threads.append(threading.current_thread())
+
+        async def collect():
+            return [
+                part async for part in
+                async_views.iterate_in_thread(parts(), close)
+            ]
+
+        self.assertEqual(async_to_sync(collect)(), [b'a', b'b'])
+        self.assertEqual(len(set(threads)), 1)
+        self.assertTrue(threads[0].name.startswith('async-stream'))
+
+    @mock.patch('posts.pubsub.STREAM_LAG', 0)
+    async def test_long_poll_under_asgi(self):
+        """Под ASGI long-poll ждет нового поста в цикле событий."""
+        communicator = await self.asgi_get(
+            reverse('follow-posts-stream'),
+            f'since={self.post.pk}&timeout=5'.encode()
+        )
+        await communicator.receive_nothing(0.2)
+        post = await sync_to_async(Post.objects.create)(
+            title='new', text='text', author=self.post.author
+        )
+        start, body = await self.receive_response(communicator)
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        data = json.loads(body)
+        self.assertEqual(data['since'], post.pk)
+        self.assertEqual(
+            [result['id'] for result in data['results']], [post.pk]
+        )
+
+    @mock.patch('api.views.STREAM_DURATION', 0)
+    @mock.patch('posts.pubsub.STREAM_LAG', 0)
+    async def test_event_stream_under_asgi(self):
+        """Под ASGI события SSE отдаются без потока на соединение."""
+        start, body = await self.receive_response(await self.asgi_get(
+            reverse('follow-posts-stream'), b'since=0',
+            [(b'accept', b'text/event-stream')]
+        ))
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        self.assertIn(
+            (b'Content-Type', b'text/event-stream'), start['headers']
+        )
+        self.assertIn(
+            f'id: {self.post.pk}\nevent: post\n'.encode(), body
+        )
+
+    def test_broker_wait_async(self):
+        """Асинхронное ожидание просыпается от события из другого потока."""
+        broker = LocalBroker()
+
+        async def wait(author_ids, timeout):
+            position = broker.position()
+            threading.Timer(0.05, broker.publish, [1]).start()
+            return await broker.wait_async(author_ids, timeout, position)
+
+        self.assertTrue(async_to_sync(wait)([1], 5))
+        self.assertFalse(async_to_sync(wait)([2], 0.2))
+        self.assertEqual(broker.waiters, set())
+
+    def test_new_post_is_published_after_timeline(self):
+        """Оповещение о посте уходит, когда пост уже в ленте подписчика."""
+        entries = []
+
+        def publish(author_id):
+            entries.append(self.user.timeline.count())
+
+        with mock.patch.object(broker, 'publish', side_effect=publish):
+            Post.objects.create(
+                title='new', text='text', author=self.post.author
+            )
+        self.assertEqual(entries, [2])
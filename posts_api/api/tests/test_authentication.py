@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..authentication import UserCache, user_cache
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+
+    def setUp(self):
+        user_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}'
+        )
+        self.url = reverse('users-detail', args=[self.user.pk])
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_user_is_loaded_once(self):
+        """Пользователь из токена читается из базы только один раз."""
+        first = self.count_queries()
+        self.assertEqual(self.count_queries(), first - 1)
+
+    def test_deactivation_invalidates_cache(self):
+        """Деактивированный пользователь сразу теряет доступ."""
+        self.count_queries()
+        user = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertEqual(
+            self.client.get(self.url).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_bulk_deactivation_with_invalidate_many(self):
+        """Массовое изменение без сигналов сбрасывается invalidate_many."""
+        self.count_queries()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        user_cache.invalidate_many([self.user.pk])
+        self.assertEqual(
+            self.client.get(self.url).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_invalidation_reaches_other_processes(self):
+        """Сброс в одном процессе делает записи других процессов чужими."""
+        other_process = UserCache(max_size=2, timeout=30)
+        self.count_queries()
+        generation = other_process.get(self.user.pk)[1]
+        other_process.set(self.user.pk, self.user, generation)
+        self.assertIsNotNone(other_process.get(self.user.pk)[0])
+        user = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertIsNone(other_process.get(self.user.pk)[0])
+
+
+class UserCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = UserCache(max_size=2, timeout=30)
+
+    def put(self, user):
+        generation = self.cache.get(user.pk)[1]
+        self.cache.set(user.pk, user, generation)
+
+    def test_lru_and_timeout(self):
+        """Кэш вытесняет давно не использованных и устаревших."""
+        self.put(User(pk=1, username='first'))
+        self.put(User(pk=2, username='second'))
+        self.assertEqual(self.cache.get(1)[0].username, 'first')
+        self.put(User(pk=3, username='third'))
+        self.assertIsNone(self.cache.get(2)[0])
+        self.assertIsNotNone(self.cache.get(1)[0])
+        with mock.patch('api.authentication.time.monotonic') as monotonic:
+            monotonic.return_value = 10 ** 9
+            self.assertIsNone(self.cache.get(1)[0])
+        self.assertEqual(self.cache.get_stats()['size'], 1)
+
+    def test_returns_copies(self):
+        """Изменения выданного объекта не попадают в кэш."""
+        self.put(User(pk=1, username='first'))
+        self.cache.get(1)[0].username = 'changed'
+        self.assertEqual(self.cache.get(1)[0].username, 'first')
+
+    def test_invalidation_during_load_is_not_lost(self):
+        """Сброс во время загрузки из базы не оставляет старую запись."""
+        generation = self.cache.get(1)[1]
+        self.cache.invalidate(1)
+        self.cache.set(1, User(pk=1, username='stale'), generation)
+        self.assertIsNone(self.cache.get(1)[0])
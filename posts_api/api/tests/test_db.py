@@ -0,0 +1,108 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from posts_api.db.pool import ConnectionPool, PoolTimeout
+
+User = get_user_model()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        return ConnectionPool(FakeConnection, **kwargs)
+
+    def test_reuses_released_connections(self):
+        """Возвращенное соединение выдается снова без подключения."""
+        pool = self.make_pool(max_size=2)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        stats = pool.get_stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 1)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_waits_for_free_connection(self):
+        """При занятом пуле acquire ждет возврата или таймаута."""
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        connection = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        pool.timeout = 5
+        timer = threading.Timer(0.05, pool.release, [connection])
+        timer.start()
+        self.assertIs(pool.acquire(), connection)
+        timer.join()
+        self.assertEqual(pool.get_stats()['waits'], 2)
+        self.assertEqual(pool.get_stats()['timeouts'], 1)
+
+    def test_health_check_and_reset_discard_broken(self):
+        """Соединения, не прошедшие проверку или сброс, закрываются."""
+        pool = self.make_pool(
+            check=lambda connection: not connection.closed,
+            reset=lambda connection: connection.state == 'ok',
+        )
+        broken = pool.acquire()
+        broken.state = 'failed'
+        pool.release(broken)
+        self.assertTrue(broken.closed)
+        healthy = pool.acquire()
+        healthy.state = 'ok'
+        pool.release(healthy)
+        healthy.closed = True
+        self.assertIsNot(pool.acquire(), healthy)
+        self.assertEqual(pool.get_stats()['discarded'], 2)
+        self.assertEqual(pool.get_stats()['size'], 1)
+
+    def test_idle_timeout_keeps_min_size(self):
+        """Простаивающие соединения закрываются до min_size."""
+        pool = self.make_pool(min_size=1, max_size=3, idle_timeout=60)
+        connections = [pool.acquire() for _ in range(3)]
+        for connection in connections:
+            pool.release(connection)
+        with mock.patch('posts_api.db.pool.time.monotonic') as monotonic:
+            monotonic.return_value = 10 ** 9
+            last = pool.acquire()
+        self.assertEqual([c.closed for c in connections], [True, True, False])
+        self.assertIs(last, connections[2])
+        self.assertEqual(pool.get_stats()['expired'], 2)
+
+    def test_close_all(self):
+        """После close_all занятые соединения закрываются при возврате."""
+        pool = self.make_pool()
+        idle, busy = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close_all()
+        pool.release(busy)
+        self.assertTrue(idle.closed and busy.closed)
+        self.assertEqual(pool.get_stats()['size'], 0)
+
+
+class DatabaseStatsTests(APITestCase):
+    def test_only_admin_sees_stats(self):
+        """Метрики соединений доступны только администратору."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='user'))
+        self.assertEqual(
+            client.get(reverse('db-stats')).status_code,
+            status.HTTP_403_FORBIDDEN
+        )
+        client.force_authenticate(User.objects.create_superuser(
+            username='admin', password='admin'
+        ))
+        response = client.get(reverse('db-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('conn_max_age', response.data['default'])
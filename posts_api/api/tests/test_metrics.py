@@ -0,0 +1,95 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from posts.models import Post
+
+from ..metrics import MetricsRegistry
+
+User = get_user_model()
+
+
+class MetricsTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        Post.objects.create(title='title', text='text', author=cls.user)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=MetricsTests.user)
+        self.registry = MetricsRegistry()
+        patchers = [
+            mock.patch(target, self.registry)
+            for target in ('api.metrics.registry', 'api.views.registry')
+        ]
+        patchers += [
+            mock.patch('api.metrics.SERVER_TIMING', True),
+            mock.patch('api.views.METRICS_TOKEN', 'secret'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_timing(self, response):
+        timing = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            timing[name] = dict(param.split('=', 1) for param in params)
+        return timing
+
+    def test_server_timing_header(self):
+        """Ответ содержит время этапов и число запросов к базе."""
+        response = self.auth_client.get(reverse('posts-list'))
+        timing = self.get_timing(response)
+        self.assertEqual(
+            list(timing), ['db', 'serialize', 'render', 'total']
+        )
+        self.assertRegex(timing['db']['desc'], r'^"[1-9]\d* queries"$')
+        self.assertGreater(float(timing['render']['dur']), 0)
+        self.assertGreaterEqual(
+            float(timing['total']['dur']), float(timing['db']['dur'])
+        )
+        with mock.patch('api.metrics.SERVER_TIMING', False):
+            response = self.auth_client.get(reverse('posts-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_metrics_endpoint(self):
+        """/metrics отдает гистограммы по представлениям."""
+        self.auth_client.get(reverse('posts-list'))
+        url = reverse('metrics')
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn(
+            'api_request_duration_seconds_count'
+            '{view="GET posts-list",stage="total"} 1',
+            content
+        )
+        self.assertIn(
+            'api_request_queries_bucket{view="GET posts-list",le="+Inf"} 1',
+            content
+        )
+        for authorization in ('', 'Bearer wrong', 'secret'):
+            with self.subTest(authorization=authorization):
+                response = self.client.get(
+                    url, HTTP_AUTHORIZATION=authorization
+                )
+                self.assertEqual(response.status_code, 403)
+        with mock.patch('api.views.METRICS_TOKEN', None):
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
+
+    def test_query_budget_warning(self):
+        """Превышение бюджета запросов пишется в лог."""
+        with mock.patch('api.metrics.QUERY_BUDGET', 0):
+            with self.assertLogs('api.metrics', 'WARNING') as logs:
+                self.auth_client.get(reverse('posts-list'))
+        self.assertIn('GET posts-list', logs.output[0])
+        with mock.patch('api.metrics.QUERY_BUDGET', 1000):
+            with mock.patch('api.metrics.logger') as logger:
+                self.auth_client.get(reverse('posts-list'))
+        logger.warning.assert_not_called()
@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from posts.models import Follow, Post, ReadStatus
+
+User = get_user_model()
+
+
+class PostQueryCountTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.authors = [
+            User.objects.create_user(username=f'Author_{number}')
+            for number in range(20)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, following=author)
+            Post.objects.create(title='title', text='text', author=author)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=PostQueryCountTests.reader)
+
+    def count_queries(self, url, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(url, {'limit': limit})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries)
+
+    def test_post_lists_run_constant_number_of_queries(self):
+        """Число запросов к спискам постов не зависит от размера страницы."""
+        for url_name in ('posts-list', 'follow-posts-list'):
+            with self.subTest(url_name=url_name):
+                url = reverse(url_name)
+                self.assertEqual(
+                    self.count_queries(url, 1), self.count_queries(url, 20)
+                )
+
+
+class PostDetailQueryCountTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        Follow.objects.create(user=cls.reader, following=cls.author)
+        cls.post = Post.objects.create(
+            title='title', text='text', author=cls.author
+        )
+        cls.url = reverse('posts-detail', kwargs={'pk': cls.post.pk})
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(
+            user=PostDetailQueryCountTests.reader
+        )
+        cache.clear()
+
+    def test_detail_marks_read_in_two_queries(self):
+        """Просмотр поста выполняет не больше двух запросов.
+
+        Счетчик непрочитанных уменьшается при записи буфера отметок,
+        повторный просмотр берет тело поста из кэша.
+        """
+        for expected_queries in (2, 1):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertNumQueries(expected_queries):
+                    response = self.auth_client.get(
+                        PostDetailQueryCountTests.url
+                    )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data['read_status'])
+        self.assertEqual(
+            ReadStatus.objects.filter(
+                user=PostDetailQueryCountTests.reader,
+                post=PostDetailQueryCountTests.post
+            ).count(),
+            1
+        )
+        response = self.auth_client.get(reverse('follow-posts-unread-count'))
+        self.assertEqual(response.data, {'count': 0})
+
+    def test_detail_of_missing_post_returns_not_found(self):
+        """Запрос несуществующего поста возвращает 404."""
+        response = self.auth_client.get(
+            reverse('posts-detail', kwargs={'pk': 0})
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
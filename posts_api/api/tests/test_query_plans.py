@@ -0,0 +1,181 @@
+import json
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from posts.models import Follow, Post, ReadStatus
+
+User = get_user_model()
+
+LARGE_TABLES = (
+    'posts_post',
+    'posts_follow',
+    'posts_readstatus',
+    'posts_timelineentry',
+    'posts_unreadcounter',
+)
+
+ALIAS_PATTERN = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+
+# Узлы PostgreSQL, которые отдают строки дочернего узла по мере чтения:
+# под LIMIT полный проход по индексу через них заменяет сортировку.
+STREAMING_NODES = (
+    'Limit', 'Append', 'Merge Append', 'Gather Merge', 'Nested Loop',
+    'Result', 'Subquery Scan', 'Unique',
+)
+
+
+class QueryPlanTests(APITestCase):
+    """EXPLAIN для запросов эндпоинтов на заполненной базе.
+
+    Тест падает, если в плане есть последовательное чтение большой
+    таблицы. В PostgreSQL seq scan отключается, чтобы он появлялся в
+    плане только при отсутствии подходящего индекса. Полным чтением
+    считается и Index Scan без Index Cond, если он не отдает строки под
+    LIMIT в порядке индекса, а также Filter с SubPlan, который
+    выполняется для каждой строки. В SQLite полным чтением считается
+    SCAN без индекса или SCAN по индексу с сортировкой результата во
+    временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        authors = [
+            User.objects.create_user(username=f'Author_{number}')
+            for number in range(10)
+        ]
+        readers = [
+            User.objects.create_user(username=f'Reader_{number}')
+            for number in range(20)
+        ]
+        cls.reader = readers[0]
+        for number, reader in enumerate(readers):
+            for shift in range(3):
+                Follow.objects.create(
+                    user=reader,
+                    following=authors[(number + shift) % len(authors)]
+                )
+        posts = [
+            Post.objects.create(title='title', text='text', author=author)
+            for _ in range(20)
+            for author in authors
+        ]
+        ReadStatus.objects.bulk_create([
+            ReadStatus(user=reader, post=post)
+            for reader in readers
+            for post in posts[::7]
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=QueryPlanTests.reader)
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return plan[0]['Plan']
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            ]
+
+    def find_sequential_scans(self, sql):
+        if connection.vendor == 'postgresql':
+            return self.find_full_reads(self.get_plan(sql))
+        aliases = {}
+        for table, alias in ALIAS_PATTERN.findall(sql):
+            aliases.setdefault(alias, set()).add(table)
+        plan = self.get_plan(sql)
+        sorted_in_memory = any(
+            'USE TEMP B-TREE FOR ORDER BY' in line for line in plan
+        )
+        scans = []
+        for line in plan:
+            # Полный проход по индексу допустим, только если он
+            # заменяет сортировку.
+            match = re.search(r'\bSCAN (\w+)( USING)?', line)
+            if match and match.group(2) and not sorted_in_memory:
+                match = None
+            if match is None:
+                continue
+            tables = aliases.get(match.group(1), {match.group(1)})
+            if tables & set(LARGE_TABLES):
+                scans.append(line)
+        return scans
+
+    def find_full_reads(self, node, streamed=False):
+        """Узлы плана PostgreSQL, читающие большую таблицу целиком."""
+        node_type = node['Node Type']
+        description = f"{node_type} on {node.get('Relation Name')}"
+        scans = []
+        if node.get('Relation Name') in LARGE_TABLES:
+            if node_type == 'Seq Scan':
+                scans.append(description)
+            elif (
+                node_type in ('Index Scan', 'Index Only Scan')
+                and 'Index Cond' not in node
+                and not streamed
+            ):
+                scans.append(description)
+        for key in ('Filter', 'Join Filter'):
+            if 'SubPlan' in node.get(key, ''):
+                scans.append(f'{description}: {key}: {node[key]}')
+        streamed = (
+            (streamed or node_type == 'Limit')
+            and node_type in STREAMING_NODES
+        )
+        for child in node.get('Plans', ()):
+            scans += self.find_full_reads(
+                child,
+                streamed and child.get('Parent Relationship') != 'Inner'
+            )
+        return scans
+
+    def assertNoSequentialScans(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            with self.subTest(url=url, sql=sql):
+                self.assertEqual(self.find_sequential_scans(sql), [])
+        return response
+
+    def test_endpoints_use_indexes(self):
+        """Запросы эндпоинтов не читают большие таблицы целиком."""
+        post = Post.objects.filter(author__username='Author_0').first()
+        response = self.assertNoSequentialScans(
+            reverse('posts-list'), {'cursor': '', 'limit': 20}
+        )
+        self.assertNoSequentialScans(response.data['next'])
+        response = self.assertNoSequentialScans(
+            reverse('follow-posts-list'), {'cursor': '', 'limit': 20}
+        )
+        self.assertNoSequentialScans(response.data['next'])
+        self.assertNoSequentialScans(
+            reverse('posts-detail', kwargs={'pk': post.pk})
+        )
+        self.assertNoSequentialScans(reverse('follow-list'))
+        self.assertNoSequentialScans(
+            reverse('users-list'),
+            {'cursor': '', 'limit': 5, 'ordering': '-posts_count'}
+        )
+        self.assertNoSequentialScans(reverse('follow-posts-unread-count'))
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from ..renderers import FastJSONParser, FastJSONRenderer
+
+DATA = {
+    'results': [{
+        'id': 1,
+        'author': 'Автор',
+        'text': 'строка\u2028разделитель',
+        'pub_date': datetime(2022, 8, 4, 15, 21, 3, 123456, timezone.utc),
+        'naive': datetime(2022, 8, 4, 15, 21),
+        'price': Decimal('1.50'),
+        'lazy': gettext_lazy('Публикация'),
+        'tags': ('a', 'b'),
+        1: None,
+    }],
+    'next': None,
+}
+
+
+class FastJSONTests(SimpleTestCase):
+    def test_renderer_matches_stock_renderer(self):
+        """Быстрый рендерер дает тот же вывод, что стандартный."""
+        self.assertEqual(
+            FastJSONRenderer().render(DATA), JSONRenderer().render(DATA)
+        )
+        self.assertEqual(
+            FastJSONRenderer().render(DATA, 'application/json; indent=4'),
+            JSONRenderer().render(DATA, 'application/json; indent=4')
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_fallback_without_orjson(self):
+        """Без orjson используются стандартные рендерер и парсер."""
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(
+                FastJSONRenderer().render(DATA), JSONRenderer().render(DATA)
+            )
+            self.assertEqual(
+                FastJSONParser().parse(BytesIO(b'{"ids": [1]}')),
+                {'ids': [1]}
+            )
+
+    def test_parser_matches_stock_parser(self):
+        """Быстрый парсер разбирает JSON как стандартный."""
+        body = '{"title": "Заголовок", "ids": [1, 2]}'.encode()
+        self.assertEqual(
+            FastJSONParser().parse(BytesIO(body)),
+            JSONParser().parse(BytesIO(body))
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"ids": '))
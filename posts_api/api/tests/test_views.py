@@ -1,14 +1,33 @@
+import base64
 import json
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient, APITestCase
 
-from posts.models import Follow, Post
+from posts.models import (AuthorReadWatermark, Follow, Post, ReadStatus,
+                          ReadWatermark, UnreadCounter, UserStats)
+from posts.pubsub import LocalBroker, broker
+from posts.read_buffer import ReadMarkBuffer
+from posts.read_tracking import attach_read_status
+from posts.timeline import feed_queryset
 
-from ..serializers import FollowSerializers, PostSerializers
+from ..cache import conditional_get_check, versions
+from ..serializers import FollowSerializers, PostSerializers, UserSerializer
 
 User = get_user_model()
 
@@ -43,6 +62,7 @@ class PostsViewTests(APITestCase):
     def setUp(self):
         self.auth_client = APIClient()
         self.auth_client.force_authenticate(user=PostsViewTests.first_user)
+        cache.clear()
 
     def test_posts_list_get_return_valid_data(self):
         """GET запрос к posts-list возвращает правильные данные."""
@@ -260,3 +280,1648 @@ class UsersViewTests(APITestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(json_response, json_data)
+
+
+class TimelineTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.url = reverse('follow-posts-list')
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=TimelineTests.reader)
+
+    def get_feed_ids(self):
+        response = self.auth_client.get(TimelineTests.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['id'] for post in response.data]
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        """Подписка заполняет ленту, новые посты попадают в ленту."""
+        old_post = Post.objects.create(
+            title='old', text='old', author=TimelineTests.author
+        )
+        Follow.objects.create(
+            user=TimelineTests.reader, following=TimelineTests.author
+        )
+        new_post = Post.objects.create(
+            title='new', text='new', author=TimelineTests.author
+        )
+        self.assertEqual(self.get_feed_ids(), [new_post.pk, old_post.pk])
+        self.assertEqual(TimelineTests.reader.timeline.count(), 2)
+
+    def test_unfollow_prunes_timeline(self):
+        """Отписка удаляет посты автора из ленты."""
+        follow = Follow.objects.create(
+            user=TimelineTests.reader, following=TimelineTests.author
+        )
+        Post.objects.create(
+            title='post', text='post', author=TimelineTests.author
+        )
+        follow.delete()
+        self.assertEqual(self.get_feed_ids(), [])
+        self.assertFalse(TimelineTests.reader.timeline.exists())
+
+    def test_popular_author_is_merged_on_read(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        with mock.patch('posts.timeline.FANOUT_LIMIT', 0):
+            Follow.objects.create(
+                user=TimelineTests.reader, following=TimelineTests.author
+            )
+            post = Post.objects.create(
+                title='post', text='post', author=TimelineTests.author
+            )
+            self.assertFalse(TimelineTests.reader.timeline.exists())
+            self.assertEqual(self.get_feed_ids(), [post.pk])
+
+    def test_feed_pages_merge_timeline_and_popular_authors(self):
+        """Страницы ленты объединяют записи ленты и подмешанные посты."""
+        popular = User.objects.create_user(username='Popular')
+        Follow.objects.create(
+            user=TimelineTests.reader, following=TimelineTests.author
+        )
+        Follow.objects.create(user=TimelineTests.reader, following=popular)
+        posts = []
+        for number in range(3):
+            for author in (TimelineTests.author, popular):
+                posts.append(Post.objects.create(
+                    title='post', text='post', author=author
+                ))
+        UserStats.objects.filter(user=popular).update(fanned_out=False)
+        self.assertEqual(TimelineTests.reader.timeline.count(), 6)
+        ids = []
+        url = f'{TimelineTests.url}?cursor=&limit=4'
+        while url:
+            response = self.auth_client.get(url)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [post.pk for post in reversed(posts)])
+
+    def test_fanout_resumes_with_hysteresis(self):
+        """Раскладка возобновляется только ниже порога возврата."""
+        other = User.objects.create_user(username='Other')
+        with mock.patch('posts.timeline.FANOUT_LIMIT', 1), mock.patch(
+            'posts.timeline.FANOUT_RESUME_LIMIT', 0
+        ):
+            Follow.objects.create(
+                user=TimelineTests.reader, following=TimelineTests.author
+            )
+            Follow.objects.create(
+                user=other, following=TimelineTests.author
+            ).delete()
+            post = Post.objects.create(
+                title='post', text='post', author=TimelineTests.author
+            )
+            self.assertFalse(TimelineTests.reader.timeline.exists())
+            self.assertEqual(self.get_feed_ids(), [post.pk])
+            Follow.objects.filter(
+                user=TimelineTests.reader, following=TimelineTests.author
+            ).delete()
+            self.assertTrue(UserStats.objects.get(
+                user=TimelineTests.author
+            ).fanned_out)
+
+
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Paginated')
+        cls.posts = [
+            Post.objects.create(
+                title=f'title {number}',
+                text=f'text {number}',
+                author=cls.user
+            )
+            for number in range(5)
+        ]
+        cls.url = reverse('posts-list')
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=KeysetPaginationTests.user)
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        """Курсорная пагинация не теряет и не повторяет посты."""
+        response = self.auth_client.get(
+            KeysetPaginationTests.url, {'cursor': '', 'limit': 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        ids = [post['id'] for post in response.data['results']]
+        Post.objects.create(
+            title='new', text='new', author=KeysetPaginationTests.user
+        )
+        next_url = response.data['next']
+        while next_url:
+            response = self.auth_client.get(next_url)
+            ids += [post['id'] for post in response.data['results']]
+            next_url = response.data['next']
+        expected = [post.pk for post in reversed(KeysetPaginationTests.posts)]
+        self.assertEqual(ids, expected)
+
+    def test_limit_offset_still_supported(self):
+        """Параметры limit и offset продолжают работать."""
+        response = self.auth_client.get(
+            KeysetPaginationTests.url, {'limit': 2, 'offset': 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_cursor_returns_not_found(self):
+        """Некорректный курсор возвращает 404."""
+        response = self.auth_client.get(
+            KeysetPaginationTests.url, {'cursor': 'broken'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor_values_return_not_found(self):
+        """Значения курсора неверного типа возвращают 404."""
+        for values in (['abc', 1], [{'a': 1}, 1], [None, None], [1]):
+            with self.subTest(values=values):
+                response = self.auth_client.get(KeysetPaginationTests.url, {
+                    'cursor': base64.urlsafe_b64encode(
+                        json.dumps(values).encode()
+                    ).decode()
+                })
+                self.assertEqual(
+                    response.status_code, status.HTTP_404_NOT_FOUND
+                )
+
+    def test_users_cursor_with_null_posts_count(self):
+        """Пользователи без статистики не ломают курсор по posts_count."""
+        UserStats.objects.filter(user=KeysetPaginationTests.user).delete()
+        User.objects.create_user(username='Without_posts')
+        expected = list(User.objects.values_list('pk', flat=True))
+        for ordering in ('-posts_count', 'posts_count'):
+            with self.subTest(ordering=ordering):
+                ids = []
+                next_url = reverse('users-list') + (
+                    f'?cursor=&limit=1&ordering={ordering}'
+                )
+                while next_url:
+                    response = self.auth_client.get(next_url)
+                    self.assertEqual(
+                        response.status_code, status.HTTP_200_OK
+                    )
+                    ids += [
+                        user['id'] for user in response.data['results']
+                    ]
+                    next_url = response.data['next']
+                self.assertCountEqual(ids, expected)
+
+
+class UserStatsTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.first_user = User.objects.create_user(username='First_user')
+        cls.second_user = User.objects.create_user(username='Second_user')
+        cls.url = reverse('users-list')
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=UserStatsTests.first_user)
+
+    def get_stats(self, user):
+        user.stats.refresh_from_db()
+        return (
+            user.stats.posts_count,
+            user.stats.followers_count,
+            user.stats.following_count,
+        )
+
+    def test_stats_follow_posts_and_follows(self):
+        """Счетчики обновляются при создании и удалении постов и подписок."""
+        self.auth_client.post(
+            reverse('posts-list'),
+            {'title': 'title', 'text': 'text'},
+            format='json'
+        )
+        self.auth_client.post(
+            reverse('follow-list'),
+            {'following': UserStatsTests.second_user.username},
+            format='json'
+        )
+        self.assertEqual(self.get_stats(UserStatsTests.first_user), (1, 0, 1))
+        self.assertEqual(self.get_stats(UserStatsTests.second_user), (0, 1, 0))
+        Post.objects.filter(author=UserStatsTests.first_user).delete()
+        Follow.objects.all().delete()
+        self.assertEqual(self.get_stats(UserStatsTests.first_user), (0, 0, 0))
+        self.assertEqual(self.get_stats(UserStatsTests.second_user), (0, 0, 0))
+
+    def test_users_ordering_by_posts_count(self):
+        """Сортировка пользователей по posts_count использует счетчики."""
+        Post.objects.create(
+            title='title', text='text', author=UserStatsTests.second_user
+        )
+        response = self.auth_client.get(
+            UserStatsTests.url, {'ordering': '-posts_count'}
+        )
+        ordered = [
+            (user['username'], user['posts_count']) for user in response.data
+        ]
+        self.assertEqual(ordered, [('Second_user', 1), ('First_user', 0)])
+
+    def test_rebuild_user_stats_command(self):
+        """Команда rebuild_user_stats восстанавливает счетчики."""
+        Post.objects.create(
+            title='title', text='text', author=UserStatsTests.first_user
+        )
+        UserStats.objects.all().delete()
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assertEqual(self.get_stats(UserStatsTests.first_user), (1, 0, 0))
+
+
+class ReadStatusTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.posts = [
+            Post.objects.create(title='title', text='text', author=cls.author)
+            for _ in range(4)
+        ]
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=ReadStatusTests.reader)
+
+    def get_read_status(self):
+        response = self.auth_client.get(reverse('posts-list'))
+        return {post['id']: post['read_status'] for post in response.data}
+
+    def test_compaction_keeps_read_status(self):
+        """Сжатие статусов прочтения не меняет read_status в выдаче."""
+        first, second, third, fourth = ReadStatusTests.posts
+        for post in (first, second, fourth):
+            self.auth_client.get(
+                reverse('posts-detail', kwargs={'pk': post.pk})
+            )
+        expected = {
+            first.pk: True, second.pk: True, third.pk: False, fourth.pk: True
+        }
+        self.assertEqual(self.get_read_status(), expected)
+        with mock.patch('posts.read_tracking.COMPACTION_DELAY', timedelta()):
+            call_command('compact_read_status', stdout=StringIO())
+        self.assertEqual(
+            ReadWatermark.objects.get(user=ReadStatusTests.reader).watermark,
+            second.pk
+        )
+        self.assertEqual(
+            list(ReadStatus.objects.filter(
+                user=ReadStatusTests.reader
+            ).values_list('post_id', flat=True)),
+            [fourth.pk]
+        )
+        self.assertEqual(self.get_read_status(), expected)
+
+    def test_compaction_of_feed_only_reads(self):
+        """Прочитанная целиком лента сжимается в границы авторов, хотя
+        посты остальных авторов не прочитаны."""
+        reader = ReadStatusTests.reader
+        followed = [
+            User.objects.create_user(username=f'Followed_{number}')
+            for number in range(2)
+        ]
+        other = User.objects.create_user(username='Other')
+        feed = []
+        for _ in range(20):
+            for author in followed:
+                feed.append(Post.objects.create(
+                    title='title', text='text', author=author
+                ))
+            Post.objects.create(title='title', text='text', author=other)
+        for author in followed:
+            Follow.objects.create(user=reader, following=author)
+        self.auth_client.post(
+            reverse('posts-read'),
+            {'ids': [post.pk for post in feed]},
+            format='json'
+        )
+        expected = self.get_read_status()
+        self.assertEqual(
+            ReadStatus.objects.filter(user=reader).count(), len(feed)
+        )
+        with mock.patch('posts.read_tracking.COMPACTION_DELAY', timedelta()):
+            call_command('compact_read_status', stdout=StringIO())
+        self.assertFalse(ReadStatus.objects.filter(user=reader).exists())
+        self.assertEqual(
+            AuthorReadWatermark.objects.filter(user=reader).count(),
+            len(followed)
+        )
+        self.assertEqual(self.get_read_status(), expected)
+        unread_url = reverse('follow-posts-unread-count')
+        self.assertEqual(self.auth_client.get(unread_url).data['count'], 0)
+        self.auth_client.post(
+            reverse('posts-unread'), {'ids': [feed[0].pk]}, format='json'
+        )
+        new_post = Post.objects.create(
+            title='title', text='text', author=followed[1]
+        )
+        read_status = self.get_read_status()
+        self.assertFalse(read_status[feed[0].pk])
+        self.assertFalse(read_status[new_post.pk])
+        self.assertEqual(self.auth_client.get(unread_url).data['count'], 2)
+        self.auth_client.post(
+            reverse('posts-read'),
+            {'ids': [feed[0].pk, feed[1].pk]},
+            format='json'
+        )
+        self.assertEqual(self.auth_client.get(unread_url).data['count'], 1)
+
+
+class WriteBehindTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.posts = [
+            Post.objects.create(title='title', text='text', author=cls.author)
+            for _ in range(3)
+        ]
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=WriteBehindTests.reader)
+        self.buffer = ReadMarkBuffer(max_size=10, interval=3600)
+        for patcher in (
+            mock.patch('posts.read_tracking.WRITE_BEHIND', True),
+            mock.patch('posts.read_tracking.read_buffer', self.buffer),
+            mock.patch('api.mixins.read_buffer', self.buffer),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read(self, post):
+        self.auth_client.get(reverse('posts-detail', kwargs={'pk': post.pk}))
+
+    def get_read_ids(self):
+        response = self.auth_client.get(reverse('posts-list'))
+        return {post['id'] for post in response.data if post['read_status']}
+
+    def get_stored_ids(self):
+        return set(ReadStatus.objects.filter(
+            user=WriteBehindTests.reader
+        ).values_list('post_id', flat=True))
+
+    def test_pending_marks_are_visible(self):
+        """Отложенные отметки видны в read_status до записи в базу."""
+        first, second, _ = WriteBehindTests.posts
+        self.assertEqual(self.get_read_ids(), set())
+        self.read(first)
+        self.read(second)
+        self.assertEqual(self.get_stored_ids(), set())
+        self.assertEqual(self.get_read_ids(), {first.pk, second.pk})
+        self.buffer.flush()
+        self.assertEqual(self.get_stored_ids(), {first.pk, second.pk})
+        self.assertEqual(self.get_read_ids(), {first.pk, second.pk})
+
+    def test_discard_waits_for_flush(self):
+        """Снятие отметки дожидается идущей записи буфера."""
+        first = WriteBehindTests.posts[0]
+        self.read(first)
+        write = self.buffer.write
+        discarded = threading.Event()
+
+        def discard():
+            self.buffer.discard(WriteBehindTests.reader, [first.pk])
+            discarded.set()
+
+        def slow_write(marks, changes):
+            threading.Thread(target=discard).start()
+            self.assertFalse(discarded.wait(0.1))
+            write(marks, changes)
+
+        with mock.patch.object(self.buffer, 'write', side_effect=slow_write):
+            self.buffer.flush()
+        self.assertTrue(discarded.wait(5))
+
+    def test_flush_by_size(self):
+        """Буфер записывается пачкой, когда набирается max_size отметок."""
+        self.buffer.max_size = 2
+        first, second, third = WriteBehindTests.posts
+        self.read(first)
+        self.assertEqual(self.get_stored_ids(), set())
+        with CaptureQueriesContext(connection) as queries:
+            self.read(second)
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.get_stored_ids(), {first.pk, second.pk})
+
+    def test_flush_skips_stale_marks(self):
+        """Отметки удаленных постов и постов под границей не пишутся."""
+        first, second, third = WriteBehindTests.posts
+        ReadWatermark.objects.create(
+            user=WriteBehindTests.reader, watermark=first.pk
+        )
+        deleted = Post.objects.create(
+            title='title', text='text', author=WriteBehindTests.author
+        )
+        for post in (first, third, deleted):
+            self.read(post)
+        deleted.delete()
+        self.buffer.flush()
+        self.assertEqual(self.get_stored_ids(), {third.pk})
+
+    def test_unread_discards_pending_marks(self):
+        """Снятая отметка не записывается из буфера."""
+        first = WriteBehindTests.posts[0]
+        self.read(first)
+        self.auth_client.post(
+            reverse('posts-unread'), {'ids': [first.pk]}, format='json'
+        )
+        self.assertEqual(self.get_read_ids(), set())
+        self.buffer.flush()
+        self.assertEqual(self.get_stored_ids(), set())
+
+    def test_export_sees_pending_marks(self):
+        """Выгрузка записывает буфер и учитывает отложенные отметки."""
+        first = WriteBehindTests.posts[0]
+        self.read(first)
+        response = self.auth_client.get(reverse('posts-export'))
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            {row['id'] for row in rows if row['read_status']}, {first.pk}
+        )
+
+
+class BulkReadTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.posts = [
+            Post.objects.create(title='title', text='text', author=cls.author)
+            for _ in range(4)
+        ]
+        cls.urls = {
+            'read': reverse('posts-read'),
+            'unread': reverse('posts-unread'),
+        }
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=BulkReadTests.reader)
+
+    def get_read_ids(self):
+        response = self.auth_client.get(reverse('posts-list'))
+        return {post['id'] for post in response.data if post['read_status']}
+
+    def test_bulk_mark_read_and_unread(self):
+        """Пакетные отметки возвращают число измененных постов."""
+        first, second, third, _ = BulkReadTests.posts
+        response = self.auth_client.post(
+            BulkReadTests.urls['read'],
+            {'ids': [first.pk, second.pk, first.pk]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'changed': 2})
+        response = self.auth_client.post(
+            BulkReadTests.urls['read'],
+            {'ids': [second.pk, third.pk]},
+            format='json'
+        )
+        self.assertEqual(response.data, {'changed': 1})
+        response = self.auth_client.post(
+            BulkReadTests.urls['unread'],
+            {'ids': [first.pk, third.pk]},
+            format='json'
+        )
+        self.assertEqual(response.data, {'changed': 2})
+        self.assertEqual(self.get_read_ids(), {second.pk})
+
+    def test_mark_read_up_to_and_unread_below_watermark(self):
+        """Отметка up_to поднимает границу, ниже нее снимаются отметки."""
+        first, second, third, fourth = BulkReadTests.posts
+        self.auth_client.post(
+            BulkReadTests.urls['read'], {'ids': [second.pk]}, format='json'
+        )
+        response = self.auth_client.post(
+            BulkReadTests.urls['read'], {'up_to': third.pk}, format='json'
+        )
+        self.assertEqual(response.data, {'changed': 2})
+        self.assertEqual(
+            self.get_read_ids(), {first.pk, second.pk, third.pk}
+        )
+        response = self.auth_client.post(
+            BulkReadTests.urls['unread'], {'ids': [second.pk]}, format='json'
+        )
+        self.assertEqual(response.data, {'changed': 1})
+        self.assertEqual(self.get_read_ids(), {first.pk, third.pk})
+
+    def test_unread_below_watermark_stores_only_exceptions(self):
+        """Снятие отметки под границей хранит одну строку на пост."""
+        posts = [
+            Post.objects.create(
+                title='title', text='text', author=BulkReadTests.author
+            )
+            for _ in range(50)
+        ]
+        first = BulkReadTests.posts[0]
+        self.auth_client.post(
+            BulkReadTests.urls['read'], {'up_to': posts[-1].pk},
+            format='json'
+        )
+        response = self.auth_client.post(
+            BulkReadTests.urls['unread'],
+            {'ids': [first.pk, posts[0].pk]},
+            format='json'
+        )
+        self.assertEqual(response.data, {'changed': 2})
+        marks = ReadStatus.objects.filter(user=BulkReadTests.reader)
+        self.assertEqual(
+            set(marks.values_list('post_id', 'read')),
+            {(first.pk, False), (posts[0].pk, False)}
+        )
+        self.assertEqual(
+            ReadWatermark.objects.get(user=BulkReadTests.reader).watermark,
+            posts[-1].pk
+        )
+        read_ids = self.get_read_ids()
+        self.assertNotIn(first.pk, read_ids)
+        self.assertIn(BulkReadTests.posts[1].pk, read_ids)
+        self.auth_client.get(reverse('posts-detail', args=[first.pk]))
+        response = self.auth_client.post(
+            BulkReadTests.urls['read'], {'ids': [posts[0].pk]}, format='json'
+        )
+        self.assertEqual(response.data, {'changed': 1})
+        self.assertIn(first.pk, self.get_read_ids())
+        self.assertFalse(marks.filter(read=False).exists())
+
+    def test_up_to_is_clamped_to_last_post(self):
+        """Граница up_to не распространяется на будущие публикации."""
+        last = BulkReadTests.posts[-1]
+        response = self.auth_client.post(
+            BulkReadTests.urls['read'],
+            {'up_to': last.pk + 1000000},
+            format='json'
+        )
+        self.assertEqual(response.data, {'changed': 4})
+        self.assertEqual(
+            ReadWatermark.objects.get(user=BulkReadTests.reader).watermark,
+            last.pk
+        )
+        new_post = Post.objects.create(
+            title='title', text='text', author=BulkReadTests.author
+        )
+        self.assertNotIn(new_post.pk, self.get_read_ids())
+
+    def test_ids_and_up_to_are_mutually_exclusive(self):
+        """Нельзя передать одновременно ids и up_to."""
+        response = self.auth_client.post(
+            BulkReadTests.urls['read'],
+            {'ids': [1], 'up_to': 1},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UnreadCountTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.first_author = User.objects.create_user(username='First_author')
+        cls.second_author = User.objects.create_user(
+            username='Second_author'
+        )
+        cls.old_post = Post.objects.create(
+            title='old', text='old', author=cls.first_author
+        )
+        cls.url = reverse('follow-posts-unread-count')
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=UnreadCountTests.reader)
+
+    def get_unread(self):
+        response = self.auth_client.get(
+            UnreadCountTests.url, {'by_author': 'true'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_unread_count_follows_posts_and_reads(self):
+        """Счетчик непрочитанных учитывает подписки, посты и прочтения."""
+        first_author = UnreadCountTests.first_author
+        second_author = UnreadCountTests.second_author
+        for author in (first_author, second_author):
+            Follow.objects.create(
+                user=UnreadCountTests.reader, following=author
+            )
+        posts = [
+            Post.objects.create(title='new', text='new', author=author)
+            for author in (first_author, second_author, second_author)
+        ]
+        self.assertEqual(self.get_unread(), {
+            'count': 4,
+            'authors': [
+                {'author': 'First_author', 'count': 2},
+                {'author': 'Second_author', 'count': 2},
+            ],
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth_client.get(
+                reverse('posts-detail', kwargs={'pk': posts[1].pk})
+            )
+        self.auth_client.post(
+            reverse('posts-read'),
+            {'ids': [UnreadCountTests.old_post.pk, posts[1].pk]},
+            format='json'
+        )
+        self.assertEqual(self.get_unread()['count'], 2)
+        posts[2].delete()
+        self.auth_client.post(
+            reverse('posts-unread'),
+            {'ids': [UnreadCountTests.old_post.pk]},
+            format='json'
+        )
+        self.assertEqual(self.get_unread(), {
+            'count': 2,
+            'authors': [{'author': 'First_author', 'count': 2}],
+        })
+        self.auth_client.post(
+            reverse('posts-read'), {'up_to': posts[0].pk}, format='json'
+        )
+        self.assertEqual(self.get_unread()['count'], 0)
+
+    def test_authors_without_fanout_are_counted_on_read(self):
+        """Непрочитанные посты авторов без раскладки считаются при чтении."""
+        reader = UnreadCountTests.reader
+        author = UnreadCountTests.first_author
+        other = User.objects.create_user(username='Other')
+        with mock.patch('posts.timeline.FANOUT_LIMIT', 1), mock.patch(
+            'posts.timeline.FANOUT_RESUME_LIMIT', 1
+        ):
+            Follow.objects.create(user=reader, following=author)
+            Follow.objects.create(user=other, following=author)
+            with CaptureQueriesContext(connection) as context:
+                post = Post.objects.create(
+                    title='new', text='new', author=author
+                )
+            self.assertFalse(any(
+                'posts_unreadcounter' in query['sql']
+                for query in context.captured_queries
+            ))
+            self.assertEqual(self.get_unread(), {
+                'count': 2,
+                'authors': [{'author': 'First_author', 'count': 2}],
+            })
+            self.auth_client.post(
+                reverse('posts-read'), {'ids': [post.pk]}, format='json'
+            )
+            self.assertEqual(self.get_unread()['count'], 1)
+            Follow.objects.filter(user=other).delete()
+        self.assertEqual(
+            UnreadCounter.objects.get(user=reader, author=author).count, 1
+        )
+        self.assertEqual(self.get_unread()['count'], 1)
+
+    def test_viewing_post_under_watermark_keeps_count(self):
+        """Просмотр поста под границей прочтения не меняет счетчик."""
+        Follow.objects.create(
+            user=UnreadCountTests.reader,
+            following=UnreadCountTests.first_author
+        )
+        posts = [
+            Post.objects.create(
+                title='new', text='new', author=UnreadCountTests.first_author
+            )
+            for _ in range(4)
+        ]
+        self.auth_client.post(
+            reverse('posts-read'), {'up_to': posts[1].pk}, format='json'
+        )
+        self.assertEqual(self.get_unread()['count'], 2)
+        self.auth_client.get(reverse('posts-detail', args=[posts[0].pk]))
+        self.assertEqual(self.get_unread()['count'], 2)
+        self.assertFalse(ReadStatus.objects.filter(
+            user=UnreadCountTests.reader, post_id__lte=posts[1].pk
+        ).exists())
+
+
+class PostCacheTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Cached')
+        cls.admin = User.objects.create_superuser(username='Admin')
+        cls.post = Post.objects.create(
+            title='title', text='text', author=cls.user
+        )
+        cls.url = reverse('posts-detail', kwargs={'pk': cls.post.pk})
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=PostCacheTests.user)
+        cache.clear()
+
+    def test_cached_body_is_invalidated_on_update_and_delete(self):
+        """Кэш поста сбрасывается при изменении и удалении."""
+        self.auth_client.get(reverse('posts-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth_client.patch(
+                PostCacheTests.url, {'title': 'changed'}, format='json'
+            )
+        response = self.auth_client.get(PostCacheTests.url)
+        self.assertEqual(response.data['title'], 'changed')
+        with self.captureOnCommitCallbacks(execute=True):
+            PostCacheTests.user.username = 'Renamed'
+            PostCacheTests.user.save()
+        response = self.auth_client.get(reverse('posts-list'))
+        self.assertEqual(response.data[0]['author'], 'Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth_client.delete(PostCacheTests.url)
+        response = self.auth_client.get(PostCacheTests.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_saving_user_without_rename_keeps_cache(self):
+        """Сохранение пользователя без смены имени не сбрасывает кэш."""
+        user = User.objects.get(pk=PostCacheTests.user.pk)
+        with mock.patch('api.cache.post_cache.invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                user.last_login = timezone.now()
+                user.save(update_fields=['last_login'])
+                user.save()
+            invalidate.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                user.username = 'Renamed_again'
+                user.save()
+            invalidate.assert_called_once_with([PostCacheTests.post.pk])
+
+    def test_cache_is_invalidated_after_commit(self):
+        """Кэш поста сбрасывается только после фиксации транзакции."""
+        self.auth_client.get(PostCacheTests.url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            PostCacheTests.post.title = 'changed'
+            PostCacheTests.post.save()
+        response = self.auth_client.get(PostCacheTests.url)
+        self.assertEqual(response.data['title'], 'title')
+        for callback in callbacks:
+            callback()
+        response = self.auth_client.get(PostCacheTests.url)
+        self.assertEqual(response.data['title'], 'changed')
+
+    def test_cache_stats_available_to_admin_only(self):
+        """Метрики кэша доступны только администратору."""
+        url = reverse('posts-cache-stats')
+        response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=PostCacheTests.admin)
+        response = admin_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data), {'hits', 'misses', 'sets', 'invalidations'}
+        )
+
+
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Polling')
+        cls.author = User.objects.create_user(username='Author')
+        cls.post = Post.objects.create(
+            title='title', text='text', author=cls.author
+        )
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=ConditionalGetTests.user)
+        patcher = mock.patch.object(versions, 'shared', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertNotModified(self, url, etag):
+        with self.assertNumQueries(0):
+            response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_read_endpoints_return_not_modified(self):
+        """Неизмененные данные отдаются с кодом 304 без запросов к базе."""
+        author_pk = ConditionalGetTests.author.pk
+        urls = [
+            reverse('posts-list'),
+            reverse('follow-posts-list'),
+            reverse('users-list'),
+            reverse('users-detail', kwargs={'pk': author_pk}),
+            reverse('follow-list'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.auth_client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIn('Last-Modified', response)
+                self.assertNotModified(url, response['ETag'])
+
+    def test_post_detail_is_not_conditional(self):
+        """Повторный просмотр поста не отвечает 304 и отмечает прочтение."""
+        url = reverse('posts-detail', args=[ConditionalGetTests.post.pk])
+        response = self.auth_client.get(url)
+        self.assertNotIn('ETag', response)
+        ReadStatus.objects.all().delete()
+        response = self.auth_client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(ReadStatus.objects.filter(
+            user=ConditionalGetTests.user, post=ConditionalGetTests.post
+        ).exists())
+
+    def test_local_cache_disables_validators(self):
+        """Версии в памяти процесса не дают ETag и 304."""
+        with mock.patch.object(versions, 'shared', None):
+            response = self.auth_client.get(reverse('posts-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+
+    def test_local_cache_is_reported(self):
+        """Без общего кэша проверка предупреждает, а явное требование
+        условных GET не дает запуститься."""
+        with mock.patch.object(versions, 'shared', False):
+            self.assertEqual(
+                [message.id for message in conditional_get_check(None)],
+                ['api.W001']
+            )
+            with mock.patch.object(versions, 'conditional', True):
+                with self.assertRaises(ImproperlyConfigured):
+                    versions.check_backend()
+            with mock.patch.object(versions, 'conditional', False):
+                self.assertEqual(conditional_get_check(None), [])
+        with mock.patch.object(versions, 'conditional', False):
+            response = self.auth_client.get(reverse('posts-list'))
+        self.assertNotIn('ETag', response)
+
+    def test_changes_produce_new_etag(self):
+        """Изменения данных меняют ETag."""
+        posts_url = reverse('posts-list')
+        feed_url = reverse('follow-posts-list')
+        etags = {
+            url: self.auth_client.get(url)['ETag']
+            for url in (posts_url, feed_url)
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(
+                user=ConditionalGetTests.user,
+                following=ConditionalGetTests.author
+            )
+        response = self.auth_client.get(
+            feed_url, HTTP_IF_NONE_MATCH=etags[feed_url]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotModified(posts_url, etags[posts_url])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth_client.post(
+                reverse('posts-read'),
+                {'ids': [ConditionalGetTests.post.pk]},
+                format='json'
+            )
+        response = self.auth_client.get(
+            posts_url, HTTP_IF_NONE_MATCH=etags[posts_url]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data[0]['read_status'])
+
+
+class SearchTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Searcher')
+        cls.author = User.objects.create_user(username='Writer')
+        cls.in_title = Post.objects.create(
+            title='django tips', text='about python', author=cls.author
+        )
+        cls.in_text = Post.objects.create(
+            title='notes', text='django and python', author=cls.author
+        )
+        cls.other = Post.objects.create(
+            title='garden', text='tomatoes', author=cls.user
+        )
+        Follow.objects.create(user=cls.user, following=cls.author)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=SearchTests.user)
+
+    def get_ids(self, url, params):
+        response = self.auth_client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data
+        if isinstance(results, dict):
+            results = results['results']
+        return [post['id'] for post in results]
+
+    def test_search_ranks_title_matches_first(self):
+        """Поиск находит посты по заголовку и тексту и ранжирует их."""
+        expected = [SearchTests.in_title.pk, SearchTests.in_text.pk]
+        for url in (reverse('posts-list'), reverse('follow-posts-list')):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.get_ids(url, {'search': 'django'}), expected
+                )
+                self.assertEqual(
+                    self.get_ids(url, {'search': 'django python'}),
+                    expected
+                )
+                self.assertEqual(self.get_ids(url, {'search': 'rust'}), [])
+
+    def test_search_with_cursor_pagination(self):
+        """Курсорная пагинация сохраняет порядок релевантности."""
+        url = reverse('posts-list')
+        response = self.auth_client.get(
+            url, {'search': 'django', 'cursor': '', 'limit': 1}
+        )
+        ids = [post['id'] for post in response.data['results']]
+        response = self.auth_client.get(response.data['next'])
+        ids += [post['id'] for post in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            ids, [SearchTests.in_title.pk, SearchTests.in_text.pk]
+        )
+
+    def test_cursor_pages_through_tied_ranks(self):
+        """Курсор проходит посты с одинаковой релевантностью без пропусков.
+
+        В PostgreSQL релевантность дробная, и курсор должен передавать
+        её без округления.
+        """
+        tied = [
+            Post.objects.create(
+                title='tied django', text='tied django python',
+                author=SearchTests.author
+            )
+            for _ in range(5)
+        ]
+        url = reverse('posts-list')
+        params = {'search': 'tied django', 'cursor': '', 'limit': 2}
+        ids = []
+        while url is not None and len(ids) <= len(tied):
+            response = self.auth_client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [post['id'] for post in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ids, [post.pk for post in reversed(tied)])
+
+
+class UsernameSearchTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.quiet = User.objects.create_user(username='alex_quiet')
+        cls.busy = User.objects.create_user(username='Alexey')
+        cls.other = User.objects.create_user(username='Malex')
+        for _ in range(2):
+            Post.objects.create(title='title', text='text', author=cls.busy)
+        Post.objects.create(title='title', text='text', author=cls.other)
+        for author in (cls.quiet, cls.busy, cls.other):
+            Follow.objects.create(user=cls.user, following=author)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=UsernameSearchTests.user)
+
+    def test_search_users_and_follows_by_substring(self):
+        """Поиск находит пользователей и подписки по подстроке имени."""
+        response = self.auth_client.get(
+            reverse('users-list'), {'search': 'ALEX'}
+        )
+        self.assertEqual(
+            sorted(user['username'] for user in response.data),
+            ['Alexey', 'Malex', 'alex_quiet']
+        )
+        response = self.auth_client.get(
+            reverse('follow-list'), {'search': 'lexe'}
+        )
+        self.assertEqual(
+            [follow['following'] for follow in response.data], ['Alexey']
+        )
+
+    def test_typeahead_orders_prefix_matches_by_posts_count(self):
+        """Подсказки ищут по префиксу и сортируются по числу постов."""
+        url = reverse('users-typeahead')
+        response = self.auth_client.get(url, {'q': 'alex'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [user['username'] for user in response.data],
+            ['Alexey', 'alex_quiet']
+        )
+        response = self.auth_client.get(url, {'q': 'alex', 'limit': 1})
+        self.assertEqual(
+            [user['username'] for user in response.data], ['Alexey']
+        )
+        UsernameSearchTests.quiet.username = 'Zed'
+        UsernameSearchTests.quiet.save()
+        response = self.auth_client.get(url, {'q': 'z'})
+        self.assertEqual(
+            [user['username'] for user in response.data], ['Zed']
+        )
+        response = self.auth_client.get(url, {'limit': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_typeahead_caps_candidates_and_ranks_missing_stats_last(self):
+        """Много совпадений проверяет база, пользователи без счетчиков
+        идут последними."""
+        url = reverse('users-typeahead')
+        User.objects.create_user(username='Alexander')
+        UserStats.objects.filter(user=UsernameSearchTests.quiet).delete()
+        expected = ['Alexey', 'Alexander', 'alex_quiet']
+        response = self.auth_client.get(url, {'q': 'alex'})
+        self.assertEqual(
+            [user['username'] for user in response.data], expected
+        )
+        with mock.patch('posts.user_search.PREFIX_CANDIDATES', 1):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.auth_client.get(url, {'q': 'alex'})
+        self.assertEqual(
+            [user['username'] for user in response.data], expected
+        )
+        self.assertNotIn(' IN (', queries.captured_queries[-1]['sql'])
+
+
+class FastPathTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Автор')
+        User.objects.create_user(username='Without_stats')
+        UserStats.objects.filter(user__username='Without_stats').delete()
+        Follow.objects.create(user=cls.user, following=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                title=f'Заголовок "{number}"',
+                text='текст\nс переносом \u2028 и символами <>&',
+                author=author
+            )
+            for number in range(3)
+            for author in (cls.user, cls.author)
+        ]
+        ReadStatus.objects.create(user=cls.user, post=cls.posts[1])
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=FastPathTests.user)
+
+    def render(self, serializer_class, instances):
+        return JSONRenderer().render(
+            serializer_class(instances, many=True).data
+        )
+
+    def ordered_like(self, response, queryset):
+        ids = [item['id'] for item in response.data]
+        return sorted(queryset, key=lambda instance: ids.index(instance.pk))
+
+    def test_post_lists_match_serializer_output(self):
+        """Списки постов совпадают с выводом сериализатора побайтово."""
+        user = FastPathTests.user
+        querysets = {
+            'posts-list': Post.objects.all(),
+            'follow-posts-list': feed_queryset(user),
+        }
+        for url_name, queryset in querysets.items():
+            with self.subTest(url_name=url_name):
+                response = self.auth_client.get(reverse(url_name))
+                posts = self.ordered_like(
+                    response, queryset.select_related('author')
+                )
+                attach_read_status(user, posts)
+                self.assertEqual(
+                    response.content, self.render(PostSerializers, posts)
+                )
+
+    def test_user_list_matches_serializer_output(self):
+        """Список пользователей совпадает с выводом сериализатора."""
+        response = self.auth_client.get(reverse('users-list'))
+        users = self.ordered_like(
+            response, User.objects.annotate(
+                posts_count=F('stats__posts_count')
+            )
+        )
+        self.assertIn(None, [user.posts_count for user in users])
+        self.assertEqual(
+            response.content, self.render(UserSerializer, users)
+        )
+
+
+class ExportTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Analyst')
+        cls.author = User.objects.create_user(username='Author')
+        cls.stranger = User.objects.create_user(username='Stranger')
+        Follow.objects.create(user=cls.user, following=cls.author)
+        cls.posts = [
+            Post.objects.create(title='title', text='text', author=author)
+            for _ in range(3)
+            for author in (cls.author, cls.stranger)
+        ]
+        ReadStatus.objects.create(user=cls.user, post=cls.posts[2])
+        ReadWatermark.objects.create(
+            user=cls.user, watermark=cls.posts[0].pk
+        )
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=ExportTests.user)
+        cache.clear()
+
+    def export(self, url_name):
+        with self.assertNumQueries(1):
+            response = self.auth_client.get(reverse(f'{url_name}-export'))
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_matches_list(self):
+        """Выгрузка совпадает со списком, упорядоченным по номеру поста."""
+        for url_name in ('posts', 'follow-posts'):
+            with self.subTest(url_name=url_name):
+                rows = self.export(url_name)
+                listed = self.auth_client.get(
+                    reverse(f'{url_name}-list')
+                ).data
+                self.assertEqual(
+                    rows, sorted(listed, key=lambda post: post['id'])
+                )
+        read = [
+            post['id'] for post in self.export('posts')
+            if post['read_status']
+        ]
+        self.assertEqual(
+            read, [ExportTests.posts[0].pk, ExportTests.posts[2].pk]
+        )
+
+    def test_export_is_sent_in_chunks(self):
+        """Выгрузка отдается пачками заданного размера."""
+        with mock.patch('api.mixins.EXPORT_CHUNK_SIZE', 4):
+            response = self.auth_client.get(reverse('posts-export'))
+            chunks = list(response.streaming_content)
+        self.assertEqual(
+            [chunk.count(b'\n') for chunk in chunks], [4, 2]
+        )
+
+
+class BulkCreateTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Importer')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.authors = [
+            User.objects.create_user(username=f'Author_{number}')
+            for number in range(10)
+        ]
+        Follow.objects.create(user=cls.follower, following=cls.user)
+        Follow.objects.create(user=cls.user, following=cls.authors[0])
+        for author in cls.authors[:2]:
+            Post.objects.create(title='title', text='text', author=author)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=BulkCreateTests.user)
+        self.follower_client = APIClient()
+        self.follower_client.force_authenticate(
+            user=BulkCreateTests.follower
+        )
+        cache.clear()
+
+    def test_bulk_create_posts(self):
+        """Пачка постов создается с производными данными и ошибками."""
+        user = BulkCreateTests.user
+        items = [
+            {'title': 'first', 'text': 'text'},
+            {'title': 'broken'},
+            {'title': 'second', 'text': 'text'},
+        ]
+        response = self.auth_client.post(
+            reverse('posts-bulk'), {'items': items}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [post['title'] for post in response.data['created']],
+            ['first', 'second']
+        )
+        self.assertEqual(
+            response.data['errors'],
+            [{'index': 1, 'errors': {'text': [ErrorDetail(
+                string='This field is required.', code='required'
+            )]}}]
+        )
+        ids = [post['id'] for post in response.data['created']]
+        self.assertEqual(
+            set(Post.objects.filter(author=user).values_list('id', flat=True)),
+            set(ids)
+        )
+        self.assertEqual(
+            ReadStatus.objects.filter(user=user, post_id__in=ids).count(), 2
+        )
+        self.assertEqual(UserStats.objects.get(user=user).posts_count, 2)
+        feed = self.follower_client.get(reverse('follow-posts-list')).data
+        self.assertEqual(
+            sorted(post['id'] for post in feed if not post['read_status']),
+            sorted(ids)
+        )
+        unread = self.follower_client.get(
+            reverse('follow-posts-unread-count')
+        ).data
+        self.assertEqual(unread['count'], 2)
+
+    def test_bulk_import_follows(self):
+        """Пачка подписок проверяется целиком и создает производные данные."""
+        user = BulkCreateTests.user
+        authors = BulkCreateTests.authors
+        items = [
+            {'following': authors[1].username},
+            {'following': authors[0].username},
+            {'following': user.username},
+            {'following': 'Nobody'},
+            {'following': authors[1].username},
+            {},
+            {'following': authors[2].username},
+        ]
+        response = self.auth_client.post(
+            reverse('follow-bulk'), {'items': items}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [follow['following'] for follow in response.data['created']],
+            [authors[1].username, authors[2].username]
+        )
+        self.assertEqual(
+            [error['index'] for error in response.data['errors']],
+            [1, 2, 3, 4, 5]
+        )
+        self.assertEqual(
+            response.data['errors'][1]['errors'],
+            {'non_field_errors': ['Подписка на себя невозможна!']}
+        )
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(stats.following_count, 3)
+        self.assertEqual(
+            UserStats.objects.get(user=authors[1]).followers_count, 1
+        )
+        feed = self.auth_client.get(reverse('follow-posts-list')).data
+        self.assertEqual(
+            {post['author'] for post in feed},
+            {authors[0].username, authors[1].username}
+        )
+        unread = self.auth_client.get(
+            reverse('follow-posts-unread-count'), {'by_author': 'true'}
+        ).data
+        self.assertEqual(unread['count'], 2)
+
+    def test_bulk_follow_validation_does_not_query_per_item(self):
+        """Число запросов не зависит от размера пачки подписок."""
+        authors = BulkCreateTests.authors
+        counts = []
+        for batch in (authors[3:5], authors[5:10]):
+            items = [{'following': author.username} for author in batch]
+            with CaptureQueriesContext(connection) as context:
+                response = self.auth_client.post(
+                    reverse('follow-bulk'), {'items': items}, format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_requires_items(self):
+        """Пустая пачка и пачка без корректных элементов отклоняются."""
+        response = self.auth_client.post(
+            reverse('posts-bulk'), {'items': []}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.auth_client.post(
+            reverse('follow-bulk'),
+            {'items': [{'following': 'Nobody'}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], [])
+
+
+class StreamTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Listener')
+        cls.author = User.objects.create_user(username='Author')
+        cls.stranger = User.objects.create_user(username='Stranger')
+        Follow.objects.create(user=cls.user, following=cls.author)
+        cls.post = Post.objects.create(
+            title='title', text='text', author=cls.author
+        )
+        Post.objects.create(title='title', text='text', author=cls.stranger)
+        cls.url = reverse('follow-posts-stream')
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=StreamTests.user)
+        patcher = mock.patch('posts.pubsub.STREAM_LAG', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_broker_wakes_waiters_for_followed_authors(self):
+        """Брокер будит ожидающих только постами их авторов."""
+        broker = LocalBroker()
+        position = broker.position()
+        broker.publish(StreamTests.stranger.pk)
+        self.assertFalse(broker.wait([StreamTests.author.pk], 0, position))
+        timer = threading.Timer(
+            0.05, broker.publish, [StreamTests.author.pk]
+        )
+        timer.start()
+        self.assertTrue(broker.wait([StreamTests.author.pk], 5, position))
+        timer.join()
+        position = broker.position()
+        broker.publish(None)
+        self.assertTrue(broker.wait([StreamTests.author.pk], 0, position))
+
+    def test_long_poll_returns_new_posts(self):
+        """Long-poll отдает посты новее курсора и ждет новых."""
+        response = self.auth_client.get(StreamTests.url)
+        self.assertEqual(
+            response.data, {'since': StreamTests.post.pk, 'results': []}
+        )
+        response = self.auth_client.get(StreamTests.url, {'since': 0})
+        self.assertEqual(
+            [post['id'] for post in response.data['results']],
+            [StreamTests.post.pk]
+        )
+        response = self.auth_client.get(
+            StreamTests.url, {'since': StreamTests.post.pk, 'timeout': 0}
+        )
+        self.assertEqual(
+            response.data, {'since': StreamTests.post.pk, 'results': []}
+        )
+
+        def publish(*args):
+            Post.objects.create(
+                title='new', text='text', author=StreamTests.author
+            )
+            return True
+
+        with mock.patch.object(broker, 'wait', side_effect=publish):
+            response = self.auth_client.get(
+                StreamTests.url, {'since': StreamTests.post.pk}
+            )
+        self.assertEqual(
+            [post['title'] for post in response.data['results']], ['new']
+        )
+        self.assertEqual(
+            response.data['since'], response.data['results'][0]['id']
+        )
+
+    def test_fresh_posts_wait_for_lag(self):
+        """Посты моложе POSTS_SYNC_LAG не отдаются и не сдвигают курсор."""
+        with mock.patch('posts.pubsub.STREAM_LAG', 60):
+            response = self.auth_client.get(StreamTests.url)
+            self.assertEqual(response.data, {'since': 0, 'results': []})
+            response = self.auth_client.get(
+                StreamTests.url, {'since': 0, 'timeout': 0}
+            )
+            self.assertEqual(response.data, {'since': 0, 'results': []})
+
+    def test_event_stream(self):
+        """При Accept: text/event-stream посты идут событиями SSE."""
+        with mock.patch('api.views.STREAM_DURATION', 0):
+            response = self.auth_client.get(
+                StreamTests.url, HTTP_ACCEPT='text/event-stream',
+                HTTP_LAST_EVENT_ID='0'
+            )
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(f'id: {StreamTests.post.pk}\nevent: post\n', content)
+        self.assertNotIn('Stranger', content)
+
+
+class SyncTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Syncer')
+        cls.author = User.objects.create_user(username='Author')
+        cls.other = User.objects.create_user(username='Other')
+        cls.post = Post.objects.create(
+            title='title', text='text', author=cls.author
+        )
+        cls.follow = Follow.objects.create(
+            user=cls.user, following=cls.author
+        )
+        Follow.objects.create(user=cls.other, following=cls.author)
+        cls.url = reverse('sync-list')
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=SyncTests.user)
+        cache.clear()
+        patcher = mock.patch('posts.changes.SYNC_LAG', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_sync(self):
+        """Без токена отдаются все посты и подписки пользователя."""
+        response = self.auth_client.get(SyncTests.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [post['id'] for post in response.data['posts']],
+            [SyncTests.post.pk]
+        )
+        self.assertEqual(
+            response.data['follows'],
+            FollowSerializers([SyncTests.follow], many=True).data
+        )
+        self.assertFalse(response.data['more'])
+        self.assertEqual(response.data['deleted_posts'], [])
+        self.assertEqual(response.data['deleted_follows'], [])
+
+    def test_changes_since_token(self):
+        """С токеном отдаются только изменения после него."""
+        token = self.auth_client.get(SyncTests.url).data['token']
+        response = self.auth_client.get(SyncTests.url, {'since': token})
+        self.assertEqual(response.data['token'], token)
+        self.assertEqual(response.data['posts'], [])
+        self.assertEqual(response.data['follows'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            SyncTests.post.text = 'changed'
+            SyncTests.post.save()
+            new_post = Post.objects.create(
+                title='new', text='text', author=SyncTests.other
+            )
+            Follow.objects.create(
+                user=SyncTests.other, following=SyncTests.user
+            )
+        response = self.auth_client.get(SyncTests.url, {'since': token})
+        self.assertEqual(
+            [(post['id'], post['text']) for post in response.data['posts']],
+            [(SyncTests.post.pk, 'changed'), (new_post.pk, 'text')]
+        )
+        self.assertEqual(response.data['follows'], [])
+        self.assertGreater(response.data['token'], token)
+
+    def test_deletes_leave_tombstones(self):
+        """Удаленные посты и подписки отдаются номерами."""
+        token = self.auth_client.get(SyncTests.url).data['token']
+        post = Post.objects.create(
+            title='new', text='text', author=SyncTests.author
+        )
+        post_id = post.pk
+        post.delete()
+        Follow.objects.filter(pk=SyncTests.follow.pk).delete()
+        response = self.auth_client.get(SyncTests.url, {'since': token})
+        self.assertEqual(response.data['posts'], [])
+        self.assertEqual(response.data['deleted_posts'], [post_id])
+        self.assertEqual(
+            response.data['deleted_follows'], [SyncTests.follow.pk]
+        )
+
+    def test_bulk_created_posts_are_logged(self):
+        """Посты из массовой загрузки попадают в журнал изменений."""
+        token = self.auth_client.get(SyncTests.url).data['token']
+        self.auth_client.post(
+            reverse('posts-bulk'),
+            {'items': [
+                {'title': 'a', 'text': 'a'}, {'title': 'b', 'text': 'b'}
+            ]},
+            format='json'
+        )
+        response = self.auth_client.get(SyncTests.url, {'since': token})
+        self.assertEqual(
+            [post['title'] for post in response.data['posts']], ['a', 'b']
+        )
+
+    def test_limit_sets_more(self):
+        """Сверх лимита изменения отдаются по частям."""
+        token = self.auth_client.get(SyncTests.url).data['token']
+        for number in range(3):
+            Post.objects.create(
+                title=str(number), text='text', author=SyncTests.author
+            )
+        with mock.patch('api.views.SYNC_LIMIT', 2):
+            response = self.auth_client.get(SyncTests.url, {'since': token})
+            self.assertTrue(response.data['more'])
+            self.assertEqual(
+                [post['title'] for post in response.data['posts']],
+                ['0', '1']
+            )
+            response = self.auth_client.get(
+                SyncTests.url, {'since': response.data['token']}
+            )
+        self.assertFalse(response.data['more'])
+        self.assertEqual(
+            [post['title'] for post in response.data['posts']], ['2']
+        )
+
+    def test_recent_changes_wait_for_lag(self):
+        """Изменения моложе POSTS_SYNC_LAG пока не отдаются."""
+        token = self.auth_client.get(SyncTests.url).data['token']
+        Post.objects.create(title='new', text='text', author=SyncTests.author)
+        with mock.patch('posts.changes.SYNC_LAG', 60):
+            response = self.auth_client.get(SyncTests.url, {'since': token})
+        self.assertEqual(response.data['posts'], [])
+        self.assertEqual(response.data['token'], token)
+
+
+class ReplicaRoutingTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Writer')
+        cls.author = User.objects.create_user(username='Author')
+        Post.objects.create(title='title', text='text', author=cls.author)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=ReplicaRoutingTests.user)
+        cache.clear()
+        # Реплика — та же база: проверяется выбор базы, а не репликация.
+        self.pick_replica = mock.Mock(return_value='default')
+        for patcher in (
+            mock.patch('posts.routers.REPLICAS', ['default']),
+            mock.patch('posts.routers.pick_replica', self.pick_replica),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reads_from_replica(self, url):
+        self.pick_replica.reset_mock()
+        response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return self.pick_replica.called
+
+    def test_get_reads_from_replica(self):
+        """Списки и объекты читаются с реплики."""
+        for url in (
+            reverse('posts-list'),
+            reverse('users-list'),
+            reverse('follow-list'),
+            reverse('follow-posts-list'),
+            reverse('users-detail', args=[ReplicaRoutingTests.author.pk]),
+        ):
+            with self.subTest(url=url):
+                self.assertTrue(self.reads_from_replica(url))
+        self.assertFalse(self.reads_from_replica(
+            reverse('follow-posts-unread-count')
+        ))
+
+    def test_write_pins_user_to_primary(self):
+        """После своей записи пользователь читает с основной базы."""
+        response = self.auth_client.post(
+            reverse('posts-list'), {'title': 'new', 'text': 'text'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(self.reads_from_replica(reverse('posts-list')))
+        other_client = APIClient()
+        other_client.force_authenticate(user=ReplicaRoutingTests.author)
+        self.pick_replica.reset_mock()
+        other_client.get(reverse('posts-list'))
+        self.assertTrue(self.pick_replica.called)
+        cache.delete(f'db-pin:{ReplicaRoutingTests.user.pk}')
+        self.assertTrue(self.reads_from_replica(reverse('posts-list')))
+
+    def test_follow_and_read_marks_pin_user(self):
+        """Подписка и отметка о прочтении тоже закрепляют пользователя."""
+        self.auth_client.post(
+            reverse('follow-list'),
+            {'following': ReplicaRoutingTests.author.username}
+        )
+        self.assertFalse(self.reads_from_replica(reverse('follow-list')))
+        cache.clear()
+        post = Post.objects.first()
+        self.auth_client.post(
+            reverse('posts-read'), {'ids': [post.pk]}, format='json'
+        )
+        self.assertFalse(self.reads_from_replica(reverse('posts-list')))
+
+    def test_no_validators_for_fresh_replica_data(self):
+        """Свежие данные с реплики отдаются без ETag."""
+        patcher = mock.patch.object(versions, 'shared', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.auth_client.get(reverse('posts-list'))
+        self.assertNotIn('ETag', response)
+        cache.set_many({
+            'version:posts': 1.0,
+            f'version:reads:{ReplicaRoutingTests.user.pk}': 1.0,
+        })
+        response = self.auth_client.get(reverse('posts-list'))
+        self.assertIn('ETag', response)
@@ -1,18 +1,20 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (FollowViewSet, MyFollowPostsViewSet, PostViewSet,
-                    UserViewSet)
+from .views import (DatabaseStatsView, FollowViewSet, MyFollowPostsViewSet,
+                    PostViewSet, SyncViewSet, UserViewSet)
 
 router = DefaultRouter()
 router.register('posts', PostViewSet, basename='posts')
 router.register('users', UserViewSet, basename='users')
 router.register('follow', FollowViewSet, basename='follow')
 router.register('follow/posts', MyFollowPostsViewSet, basename='follow-posts')
+router.register('sync', SyncViewSet, basename='sync')
 
 
 urlpatterns = [
     path('v1/auth/', include('djoser.urls')),
     path('v1/auth/', include('djoser.urls.jwt')),
+    path('v1/db-stats/', DatabaseStatsView.as_view(), name='db-stats'),
     path('v1/', include(router.urls)),
 ]
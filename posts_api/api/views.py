@@ -1,77 +1,450 @@
-from django.db.models import Count, Exists, OuterRef
-from rest_framework import filters, viewsets
+import hmac
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.http import (HttpResponse, HttpResponseForbidden,
+                         StreamingHttpResponse)
+from django.views.decorators.http import require_GET
+from rest_framework import filters, permissions, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from posts.models import Post, ReadStatus, User
+from posts.bulk import bulk_create_follows, bulk_create_posts
+from posts.changes import changes_since
+from posts.models import Change, Follow, User
+from posts.pubsub import (in_thread, last_post_id, wait_for_posts,
+                          wait_for_posts_async)
+from posts.read_buffer import read_buffer
+from posts.read_tracking import (bulk_mark_read, bulk_mark_unread,
+                                 mark_post_read, mark_read_up_to,
+                                 read_post_ids)
+from posts.timeline import feed_parts, feed_queryset
+from posts.unread_counters import unread_by_author, unread_count
+from posts.user_search import username_index
 
-from .mixins import ListCreateViewSet, ListViewSet
+from .async_views import AsyncStreamingHttpResponse
+from .cache import post_cache
+from .filters import PostSearchFilter, UsernameSearchFilter
+from .metrics import registry
+from .mixins import (ConditionalGetMixin, InstrumentedViewMixin,
+                     ListCreateViewSet, ListViewSet, PostQuerysetMixin,
+                     ReplicaReadMixin)
+from .pagination import KeysetPagination, KeysetUnion
 from .permissions import IsOwnerOrReadOnly
-from .serializers import FollowSerializers, PostSerializers, UserSerializer
+from .renderers import EventStreamRenderer, FastJSONRenderer
+from .serializers import (USER_VALUES, BulkFollowSerializer,
+                          BulkPostSerializer, FollowSerializers,
+                          PostSerializers, ReadMarksSerializer,
+                          StreamSerializer, SyncSerializer,
+                          TypeaheadSerializer, UnreadMarksSerializer,
+                          UserSerializer, user_values_to_representation)
+
+STREAM_DURATION = getattr(settings, 'POSTS_STREAM_DURATION', 300)
+
+SYNC_LIMIT = getattr(settings, 'POSTS_SYNC_LIMIT', 500)
+
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+
+
+def bulk_response(created, errors):
+    return Response(
+        {'created': created, 'errors': errors},
+        status=(
+            status.HTTP_201_CREATED if created
+            else status.HTTP_400_BAD_REQUEST
+        )
+    )
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(InstrumentedViewMixin, ReplicaReadMixin,
+                  ConditionalGetMixin, PostQuerysetMixin,
+                  viewsets.ModelViewSet):
     serializer_class = PostSerializers
     permission_classes = [IsOwnerOrReadOnly]
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
+    # Просмотр поста отмечает его прочитанным, 304 пропустил бы отметку.
+    conditional_actions = ('list', )
+
+    def get_validator_keys(self):
+        return ('posts', f'reads:{self.request.user.pk}')
 
+    @transaction.atomic
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-    def get_queryset(self):
-        post_read_status = ReadStatus.objects.filter(
-            post=OuterRef('id'), user=self.request.user
-        )
-        queryset = Post.objects.annotate(
-            read_status=Exists(post_read_status)
-        )
-        return queryset
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
 
     def retrieve(self, request, *args, **kwargs):
-        post = Post.objects.filter(pk=self.kwargs.get('pk'))
-        if not post.exists():
-            raise NotFound(detail=f'Поста с номером {post} не существует')
-        user = self.request.user
-        record = ReadStatus.objects.filter(post=post[0], user=user)
-        if not record.exists():
-            ReadStatus.objects.create(post=post[0], user=user)
-        return super().retrieve(request, *args, **kwargs)
+        pk = self.kwargs.get('pk')
+        if not pk.isdigit():
+            raise NotFound(detail=f'Поста с номером {pk} не существует')
+        pk = int(pk)
+        body = post_cache.get_many([pk]).get(pk)
+        if body is None:
+            # Тело попадет в общий кэш, поэтому читается с основной базы,
+            # а не с реплики, которая может отставать.
+            post = self.get_queryset().using(DEFAULT_DB_ALIAS).filter(
+                pk=pk
+            ).first()
+            if post is None:
+                raise NotFound(detail=f'Поста с номером {pk} не существует')
+            self.check_object_permissions(request, post)
+            body = post_cache.serialize([post])[pk]
+            post_cache.set_many({pk: body})
+        mark_post_read(request.user, pk)
+        return Response(dict(body, read_status=True))
 
+    @action(
+        detail=False,
+        url_path='cache-stats',
+        permission_classes=[permissions.IsAdminUser]
+    )
+    def cache_stats(self, request):
+        return Response(post_cache.get_stats())
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = User.objects.annotate(posts_count=Count('posts'))
+    @action(detail=False, methods=['post'])
+    def read(self, request):
+        serializer = ReadMarksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if 'up_to' in serializer.validated_data:
+            changed = mark_read_up_to(
+                request.user, serializer.validated_data['up_to']
+            )
+        else:
+            changed = bulk_mark_read(
+                request.user, serializer.validated_data['ids']
+            )
+        return Response({'changed': changed})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = BulkPostSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        posts, errors = serializer.validate_posts()
+        if posts:
+            bulk_create_posts(request.user, posts)
+        return bulk_response(PostSerializers(posts, many=True).data, errors)
+
+    @action(detail=False, methods=['post'])
+    def unread(self, request):
+        serializer = UnreadMarksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changed = bulk_mark_unread(
+            request.user, serializer.validated_data['ids']
+        )
+        return Response({'changed': changed})
+
+
+class UserViewSet(InstrumentedViewMixin, ReplicaReadMixin,
+                  ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = User.objects.annotate(posts_count=F('stats__posts_count'))
     serializer_class = UserSerializer
-    pagination_class = LimitOffsetPagination
-    filter_backends = (filters.OrderingFilter, )
+    pagination_class = KeysetPagination
+    filter_backends = (filters.OrderingFilter, UsernameSearchFilter)
     ordering_fields = ('posts_count', )
+    conditional_actions = ('list', 'retrieve', 'typeahead')
+
+    def get_validator_keys(self):
+        return ('users', )
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *USER_VALUES
+        )
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [user_values_to_representation(row) for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def get_keyset_ordering(self, request):
+        ordering = filters.OrderingFilter().get_ordering(
+            request, self.queryset, self
+        )
+        if not ordering:
+            return ('id', )
+        if ordering[0].startswith('-'):
+            return ('-posts_count', '-id')
+        return ('posts_count', 'id')
 
-class FollowViewSet(ListCreateViewSet):
+    @action(detail=False)
+    def typeahead(self, request):
+        serializer = TypeaheadSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        users = self.queryset.filter(
+            username_index.prefix_filter(serializer.validated_data['q'])
+        ).order_by(F('posts_count').desc(nulls_last=True), '-id')
+        return Response(UserSerializer(
+            users[:serializer.validated_data['limit']], many=True
+        ).data)
+
+
+class FollowViewSet(InstrumentedViewMixin, ReplicaReadMixin,
+                    ConditionalGetMixin, ListCreateViewSet):
     serializer_class = FollowSerializers
-    pagination_class = LimitOffsetPagination
-    filter_backends = (filters.SearchFilter, )
-    search_fields = ('following__username',)
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id', )
+    filter_backends = (UsernameSearchFilter, )
+    username_search_field = 'following'
+
+    def get_validator_keys(self):
+        return (f'follows:{self.request.user.pk}', 'users')
 
     def get_queryset(self):
         user = self.request.user
-        return user.follower
+        return user.follower.select_related('user', 'following')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = BulkFollowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        authors, errors = serializer.validate_follows(request.user)
+        follows = []
+        if authors:
+            follows = bulk_create_follows(request.user, authors)
+        return bulk_response(
+            FollowSerializers(follows, many=True).data, errors
+        )
+
 
-class MyFollowPostsViewSet(ListViewSet):
+class MyFollowPostsViewSet(InstrumentedViewMixin, ReplicaReadMixin,
+                           ConditionalGetMixin, PostQuerysetMixin,
+                           ListViewSet):
     serializer_class = PostSerializers
     permission_classes = [IsOwnerOrReadOnly]
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
 
-    def get_queryset(self):
-        post_read_status = ReadStatus.objects.filter(
-            post=OuterRef('id'), user=self.request.user
-        )
-        queryset = Post.objects.annotate(
-            read_status=Exists(post_read_status)
-        ).filter(
-            author__following__user=self.request.user
+    def get_validator_keys(self):
+        user_id = self.request.user.pk
+        return ('posts', f'reads:{user_id}', f'follows:{user_id}')
+
+    def get_base_queryset(self):
+        return feed_queryset(self.request.user)
+
+    def get_list_queryset(self):
+        if PostSearchFilter().get_search_query(self.request):
+            return super().get_list_queryset()
+        merged, timeline = feed_parts(self.request.user)
+        return KeysetUnion([
+            (merged.values('id', 'pub_date'), {}),
+            (timeline.values('post_id', 'pub_date'), {'id': 'post_id'}),
+        ], self.keyset_ordering)
+
+    @action(
+        detail=False,
+        renderer_classes=[FastJSONRenderer, EventStreamRenderer]
+    )
+    def stream(self, request):
+        """Новые посты ленты: long-poll с курсором since или SSE.
+
+        Без since long-poll сразу возвращает текущий курсор. С since ждет
+        до timeout секунд поста новее курсора. При Accept:
+        text/event-stream посты отправляются событиями SSE в течение
+        POSTS_STREAM_DURATION секунд.
+        """
+        serializer = StreamSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        posts = self.get_base_queryset()
+        since = serializer.validated_data.get('since')
+        timeout = serializer.validated_data['timeout']
+        asgi = isinstance(request._request, ASGIRequest)
+        if isinstance(request.accepted_renderer, EventStreamRenderer):
+            last_event_id = request.META.get('HTTP_LAST_EVENT_ID', '')
+            if since is None and last_event_id.isdigit():
+                since = int(last_event_id)
+            if since is None:
+                since = last_post_id(posts)
+            if asgi:
+                response = AsyncStreamingHttpResponse(
+                    self.async_event_stream(posts, since, timeout),
+                    content_type=EventStreamRenderer.media_type
+                )
+            else:
+                response = StreamingHttpResponse(
+                    self.event_stream(posts, since, timeout),
+                    content_type=EventStreamRenderer.media_type
+                )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+        if since is None:
+            return Response({'since': last_post_id(posts), 'results': []})
+        if asgi:
+            # Ответ отдается, когда дождемся постов, а поток свободен.
+            return AsyncStreamingHttpResponse(
+                self.async_long_poll(posts, since, timeout),
+                content_type=FastJSONRenderer.media_type
+            )
+        post_ids = wait_for_posts(request.user, posts, since, timeout)
+        return Response(self.get_stream_page(post_ids, since))
+
+    def get_stream_page(self, post_ids, since):
+        return {
+            'since': post_ids[-1] if post_ids else since,
+            'results': self.get_post_bodies(post_ids),
+        }
+
+    def get_stream_timeout(self, timeout, deadline):
+        return min(max(timeout, 1), max(deadline - time.monotonic(), 0))
+
+    def render_events(self, bodies):
+        renderer = FastJSONRenderer()
+        return [
+            b'id: %d\nevent: post\ndata: %s\n\n' % (
+                body['id'], renderer.render(body)
+            )
+            for body in bodies
+        ]
+
+    def event_stream(self, posts, since, timeout):
+        deadline = time.monotonic() + STREAM_DURATION
+        yield b'retry: 3000\n\n'
+        while True:
+            post_ids = wait_for_posts(
+                self.request.user, posts, since,
+                self.get_stream_timeout(timeout, deadline)
+            )
+            if post_ids:
+                yield from self.render_events(self.get_post_bodies(post_ids))
+                since = post_ids[-1]
+            else:
+                yield b': ping\n\n'
+            if time.monotonic() >= deadline:
+                return
+
+    async def async_event_stream(self, posts, since, timeout):
+        get_post_bodies = in_thread(self.get_post_bodies)
+        deadline = time.monotonic() + STREAM_DURATION
+        yield b'retry: 3000\n\n'
+        while True:
+            post_ids = await wait_for_posts_async(
+                self.request.user, posts, since,
+                self.get_stream_timeout(timeout, deadline)
+            )
+            if post_ids:
+                for event in self.render_events(
+                    await get_post_bodies(post_ids)
+                ):
+                    yield event
+                since = post_ids[-1]
+            else:
+                yield b': ping\n\n'
+            if time.monotonic() >= deadline:
+                return
+
+    async def async_long_poll(self, posts, since, timeout):
+        post_ids = await wait_for_posts_async(
+            self.request.user, posts, since, timeout
         )
-        return queryset
+        page = await in_thread(self.get_stream_page)(post_ids, since)
+        yield FastJSONRenderer().render(page)
+
+    @action(detail=False, url_path='unread-count')
+    def unread_count(self, request):
+        # Счетчики обновляются при записи буфера отметок.
+        read_buffer.flush()
+        data = {'count': unread_count(request.user)}
+        if request.query_params.get('by_author') in ('1', 'true'):
+            data['authors'] = [
+                {'author': author, 'count': count}
+                for author, count in unread_by_author(request.user)
+            ]
+        return Response(data)
+
+
+class SyncViewSet(InstrumentedViewMixin, viewsets.GenericViewSet):
+    def list(self, request):
+        """Изменения постов и подписок после токена since.
+
+        Возвращает созданные и измененные посты, номера удаленных постов,
+        новые подписки пользователя, номера удаленных подписок и новый
+        токен. Если изменений больше POSTS_SYNC_LIMIT, more равен true и
+        за остальными нужно прийти с новым токеном.
+        """
+        serializer = SyncSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since = serializer.validated_data['since']
+        changes, more = changes_since(request.user, since, SYNC_LIMIT)
+        # Журнал упорядочен по номеру, поэтому остается последнее
+        # действие с каждым объектом.
+        actions = {
+            (change.kind, change.object_id): change.action
+            for change in changes
+        }
+        post_ids, deleted_posts, follow_ids, deleted_follows = [], [], [], []
+        for (kind, object_id), change_action in actions.items():
+            deleted = change_action == Change.DELETED
+            if kind == Change.POST:
+                (deleted_posts if deleted else post_ids).append(object_id)
+            else:
+                (deleted_follows if deleted else follow_ids).append(object_id)
+        bodies = post_cache.get_bodies(post_ids)
+        read_ids = read_post_ids(request.user, post_ids)
+        follows = Follow.objects.filter(pk__in=follow_ids).select_related(
+            'user', 'following'
+        ).order_by('id')
+        return Response({
+            'token': changes[-1].pk if changes else since,
+            'more': more,
+            'posts': [
+                dict(bodies[post_id], read_status=post_id in read_ids)
+                for post_id in post_ids
+                if post_id in bodies
+            ],
+            'deleted_posts': deleted_posts,
+            'follows': FollowSerializers(follows, many=True).data,
+            'deleted_follows': deleted_follows,
+        })
+
+
+class DatabaseStatsView(InstrumentedViewMixin, APIView):
+    """Настройки соединений и метрики пулов текущего процесса."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            connection.alias: {
+                'vendor': connection.vendor,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'health_checks': bool(
+                    connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                ),
+                'pools': (
+                    connection.get_pool_stats()
+                    if hasattr(connection, 'get_pool_stats') else {}
+                ),
+            }
+            for connection in connections.all()
+        })
+
+
+@require_GET
+def metrics(request):
+    """Гистограммы запросов процесса в текстовом формате Prometheus.
+
+    Доступны по заголовку Authorization: Bearer METRICS_TOKEN. Адрес
+    клиента не проверяется: за прокси это адрес самого прокси. Без
+    METRICS_TOKEN метрики закрыты.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not METRICS_TOKEN or not hmac.compare_digest(
+        authorization.encode(), f'Bearer {METRICS_TOKEN}'.encode()
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.expose(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Follow, Post, ReadStatus
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,10 +11,15 @@ class PostAdmin(admin.ModelAdmin):
         'pub_date',
         'author',
     )
-    search_fields = ('text',)
+    search_fields = ('title', 'text')
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_posts(queryset, search_term), False
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'following')
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import (changes, stats, timeline,  # noqa: F401
+                       unread_counters, user_search)
+
+        # Оповещение о новом посте уходит последним, когда лента уже
+        # записана: в режиме autocommit on_commit выполняется сразу.
+        from . import pubsub  # noqa: F401
@@ -0,0 +1,52 @@
+from django.db import transaction
+
+from .models import Follow, Post, ReadStatus
+from .signals import follows_bulk_created, posts_bulk_created
+
+BATCH_SIZE = 1000
+
+
+def insert(model, objects):
+    """bulk_create с заполнением первичных ключей.
+
+    Без INSERT ... RETURNING (SQLite) ключи берутся как последние
+    номера таблицы: вызов идет внутри транзакции, а SQLite держит
+    блокировку записи до её конца, поэтому чужих строк между ними нет.
+    """
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if objects and objects[0].pk is None:
+        pks = model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:len(objects)]
+        for instance, pk in zip(objects, reversed(list(pks))):
+            instance.pk = pk
+            instance._state.adding = False
+    return objects
+
+
+@transaction.atomic
+def bulk_create_posts(author, posts):
+    for post in posts:
+        post.author = author
+    insert(Post, posts)
+    ReadStatus.objects.bulk_create(
+        [ReadStatus(user=author, post=post) for post in posts],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    posts_bulk_created.send(sender=Post, author_id=author.pk, posts=posts)
+    return posts
+
+
+@transaction.atomic
+def bulk_create_follows(user, authors):
+    follows = insert(Follow, [
+        Follow(user=user, following=author) for author in authors
+    ])
+    follows_bulk_created.send(
+        sender=Follow,
+        user_id=user.pk,
+        following_ids=[author.pk for author in authors],
+        follows=follows,
+    )
+    return follows
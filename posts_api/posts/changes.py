@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Change, Follow, Post
+from .signals import follows_bulk_created, posts_bulk_created
+
+BATCH_SIZE = 1000
+
+SYNC_LAG = getattr(settings, 'POSTS_SYNC_LAG', 2)
+
+
+def post_change(post_id, action):
+    return Change(kind=Change.POST, action=action, object_id=post_id)
+
+
+def follow_change(follow, action):
+    return Change(
+        kind=Change.FOLLOW,
+        action=action,
+        object_id=follow.pk,
+        user_id=follow.user_id,
+    )
+
+
+def changes_since(user, since, limit):
+    """Изменения постов и подписок пользователя новее since.
+
+    Возвращает изменения по возрастанию номера и признак того, что
+    изменений больше limit. Оба запроса идут по индексам журнала, поэтому
+    их стоимость зависит от числа изменений, а не от объема данных.
+
+    Номера записей выдаются до фиксации транзакций, поэтому изменения
+    моложе POSTS_SYNC_LAG секунд не отдаются: иначе запись из еще не
+    зафиксированной транзакции с меньшим номером оказалась бы позади
+    выданного токена.
+    """
+    changes = Change.objects.filter(
+        pk__gt=since, created__lte=timezone.now() - timedelta(seconds=SYNC_LAG)
+    ).order_by('pk')
+    streams = [
+        list(changes.filter(kind=Change.POST)[:limit + 1]),
+        list(changes.filter(user_id=user.pk, kind=Change.FOLLOW)[:limit + 1]),
+    ]
+    bounds = [rows[limit - 1].pk for rows in streams if len(rows) > limit]
+    if not bounds:
+        return sorted(streams[0] + streams[1], key=lambda c: c.pk), False
+    bound = min(bounds)
+    return sorted(
+        [change for rows in streams for change in rows if change.pk <= bound],
+        key=lambda change: change.pk
+    ), True
+
+
+@receiver(post_save, sender=Post)
+def post_saved_handler(sender, instance, created, **kwargs):
+    post_change(
+        instance.pk, Change.CREATED if created else Change.UPDATED
+    ).save()
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_handler(sender, instance, **kwargs):
+    post_change(instance.pk, Change.DELETED).save()
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved_handler(sender, instance, created, **kwargs):
+    if created:
+        follow_change(instance, Change.CREATED).save()
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted_handler(sender, instance, **kwargs):
+    follow_change(instance, Change.DELETED).save()
+
+
+@receiver(posts_bulk_created, sender=Post)
+def posts_bulk_created_handler(sender, posts, **kwargs):
+    Change.objects.bulk_create(
+        [post_change(post.pk, Change.CREATED) for post in posts],
+        batch_size=BATCH_SIZE,
+    )
+
+
+@receiver(follows_bulk_created, sender=Follow)
+def follows_bulk_created_handler(sender, follows, **kwargs):
+    Change.objects.bulk_create(
+        [follow_change(follow, Change.CREATED) for follow in follows],
+        batch_size=BATCH_SIZE,
+    )
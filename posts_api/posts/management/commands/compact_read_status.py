@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import ReadStatus, User
+from posts.read_tracking import compact
+
+
+class Command(BaseCommand):
+    help = 'Сжимает статусы прочтения в границы прочтения пользователей.'
+
+    def handle(self, *args, **options):
+        user_ids = ReadStatus.objects.values_list(
+            'user_id', flat=True
+        ).distinct()
+        for user in User.objects.filter(pk__in=user_ids).iterator():
+            compact(user)
+        self.stdout.write(self.style.SUCCESS('Статусы прочтения сжаты.'))
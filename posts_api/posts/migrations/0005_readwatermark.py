@@ -0,0 +1,68 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def convert_read_status(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    ReadStatus = apps.get_model('posts', 'ReadStatus')
+    ReadWatermark = apps.get_model('posts', 'ReadWatermark')
+    last_post_id = Post.objects.aggregate(last=models.Max('id'))['last']
+    user_ids = ReadStatus.objects.values_list('user_id', flat=True).distinct()
+    for user_id in list(user_ids):
+        read_ids = ReadStatus.objects.filter(user_id=user_id).values('post_id')
+        first_unread = Post.objects.exclude(id__in=read_ids).order_by(
+            'id'
+        ).values_list('id', flat=True).first()
+        if first_unread is None:
+            watermark = last_post_id
+        else:
+            watermark = first_unread - 1
+        if not watermark:
+            continue
+        ReadWatermark.objects.create(user_id=user_id, watermark=watermark)
+        ReadStatus.objects.filter(
+            user_id=user_id, post_id__lte=watermark
+        ).delete()
+
+
+def expand_read_status(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    ReadStatus = apps.get_model('posts', 'ReadStatus')
+    ReadWatermark = apps.get_model('posts', 'ReadWatermark')
+    for read_watermark in ReadWatermark.objects.all():
+        post_ids = Post.objects.filter(
+            id__lte=read_watermark.watermark
+        ).values_list('id', flat=True)
+        ReadStatus.objects.bulk_create(
+            [
+                ReadStatus(user_id=read_watermark.user_id, post_id=post_id)
+                for post_id in post_ids
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0004_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadWatermark',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='read_watermark', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('watermark', models.BigIntegerField(default=0, verbose_name='Прочитаны все публикации до номера')),
+            ],
+            options={
+                'verbose_name': 'Граница прочтения',
+                'verbose_name_plural': 'Границы прочтения',
+            },
+        ),
+        migrations.RunPython(convert_read_status, expand_read_status),
+    ]
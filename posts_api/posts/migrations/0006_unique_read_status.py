@@ -0,0 +1,26 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    ReadStatus = apps.get_model('posts', 'ReadStatus')
+    keep_ids = ReadStatus.objects.values('user_id', 'post_id').annotate(
+        keep_id=models.Min('id')
+    ).values('keep_id')
+    ReadStatus.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_readwatermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='readstatus',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_read_status'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    ReadStatus = apps.get_model('posts', 'ReadStatus')
+    ReadWatermark = apps.get_model('posts', 'ReadWatermark')
+    UnreadCounter = apps.get_model('posts', 'UnreadCounter')
+    watermarks = dict(
+        ReadWatermark.objects.values_list('user_id', 'watermark')
+    )
+    counters = []
+    for follow in Follow.objects.iterator():
+        read_ids = ReadStatus.objects.filter(
+            user_id=follow.user_id
+        ).values('post_id')
+        count = Post.objects.filter(
+            author_id=follow.following_id,
+            pk__gt=watermarks.get(follow.user_id, 0),
+        ).exclude(pk__in=read_ids).count()
+        counters.append(UnreadCounter(
+            user_id=follow.user_id, author_id=follow.following_id, count=count
+        ))
+    UnreadCounter.objects.bulk_create(
+        counters, batch_size=1000, ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_unique_read_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Непрочитанных публикаций')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор поста')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Счетчик непрочитанных',
+                'verbose_name_plural': 'Счетчики непрочитанных',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='unreadcounter',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_unread_counter'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,15 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_unreadcounter'),
+    ]
+
+    # Индексы и ограничение перенесены в 0014: там они строятся без
+    # блокировки записи в таблицы, а на базах, где эта миграция уже
+    # применена, повторно не создаются.
+    operations = []
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:42
+
+import re
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION posts_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('{config}', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('{config}', coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGER = """
+CREATE TRIGGER posts_post_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, text ON posts_post
+FOR EACH ROW EXECUTE PROCEDURE posts_post_search_vector_update();
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = getattr(settings, 'POSTS_SEARCH_CONFIG', 'russian')
+    if not re.fullmatch(r'\w+', config):
+        raise ValueError(f'Некорректная конфигурация поиска: {config}')
+    schema_editor.execute(TRIGGER_FUNCTION.format(config=config))
+    schema_editor.execute(TRIGGER)
+    schema_editor.execute('UPDATE posts_post SET title = title')
+    schema_editor.execute(
+        'CREATE INDEX post_search_vector_idx ON posts_post '
+        'USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS post_search_vector_idx')
+    schema_editor.execute(
+        'DROP TRIGGER IF EXISTS posts_post_search_vector_trigger '
+        'ON posts_post'
+    )
+    schema_editor.execute(
+        'DROP FUNCTION IF EXISTS posts_post_search_vector_update()'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:05
+
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_username_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS user_username_trgm_idx ON "{table}" '
+        'USING gin (UPPER(username::text) gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS user_username_prefix_idx ON "{table}" '
+        '(UPPER(username::text) text_pattern_ops)'
+    )
+
+
+def drop_username_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS user_username_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS user_username_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_post_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_username_indexes, drop_username_indexes),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_changes(apps, schema_editor):
+    Change = apps.get_model('posts', 'Change')
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    changes = [
+        Change(kind='post', action='created', object_id=post_id)
+        for post_id in Post.objects.order_by('id').values_list(
+            'id', flat=True
+        )
+    ] + [
+        Change(
+            kind='follow', action='created', object_id=follow_id,
+            user_id=user_id
+        )
+        for follow_id, user_id in Follow.objects.order_by('id').values_list(
+            'id', 'user_id'
+        )
+    ]
+    Change.objects.bulk_create(changes, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_username_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Публикация'), ('follow', 'Подписка')], max_length=16, verbose_name='Тип объекта')),
+                ('action', models.CharField(choices=[('created', 'Создание'), ('updated', 'Изменение'), ('deleted', 'Удаление')], max_length=16, verbose_name='Действие')),
+                ('object_id', models.BigIntegerField(verbose_name='Номер объекта')),
+                ('user_id', models.BigIntegerField(blank=True, null=True, verbose_name='Номер владельца подписки')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение',
+                'verbose_name_plural': 'Журнал изменений',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['kind', 'id'], name='change_kind_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user_id', 'kind', 'id'], name='change_user_kind_idx'),
+        ),
+        migrations.RunPython(fill_changes, migrations.RunPython.noop),
+    ]
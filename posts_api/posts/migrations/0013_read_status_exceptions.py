@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_timeline_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='readstatus',
+            name='read',
+            field=models.BooleanField(default=True, verbose_name='Прочитана'),
+        ),
+    ]
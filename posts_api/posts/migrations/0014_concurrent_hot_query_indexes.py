@@ -0,0 +1,88 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+INDEXES = (
+    'CREATE INDEX {concurrently}IF NOT EXISTS post_pub_date_idx '
+    'ON posts_post (pub_date DESC, id DESC)',
+    'CREATE INDEX {concurrently}IF NOT EXISTS post_author_pub_date_idx '
+    'ON posts_post (author_id, pub_date DESC)',
+    'CREATE UNIQUE INDEX {concurrently}IF NOT EXISTS unique_follow '
+    'ON posts_follow (user_id, following_id)',
+)
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    keep_ids = Follow.objects.values('user_id', 'following_id').annotate(
+        keep_id=models.Min('id')
+    ).values('keep_id')
+    Follow.objects.exclude(id__in=keep_ids).delete()
+
+
+def create_indexes(apps, schema_editor):
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс,
+    # который IF NOT EXISTS пропустит: его нужно удалить вручную.
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    for sql in INDEXES:
+        schema_editor.execute(sql.format(concurrently=concurrently))
+    if not postgresql:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'unique_follow'"
+        )
+        if cursor.fetchone() is None:
+            schema_editor.execute(
+                'ALTER TABLE posts_follow ADD CONSTRAINT unique_follow '
+                'UNIQUE USING INDEX unique_follow'
+            )
+
+
+def drop_indexes(apps, schema_editor):
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    if postgresql:
+        schema_editor.execute(
+            'ALTER TABLE posts_follow DROP CONSTRAINT IF EXISTS unique_follow'
+        )
+    for name in (
+        'post_pub_date_idx', 'post_author_pub_date_idx', 'unique_follow'
+    ):
+        schema_editor.execute(
+            f'DROP INDEX {concurrently}IF EXISTS {name}'
+        )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0013_read_status_exceptions'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='post',
+                    index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='post',
+                    index=models.Index(fields=['author', '-pub_date'], name='post_author_pub_date_idx'),
+                ),
+                migrations.AddConstraint(
+                    model_name='follow',
+                    constraint=models.UniqueConstraint(fields=('user', 'following'), name='unique_follow'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0014_concurrent_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.BigIntegerField(default=0, verbose_name='Прочитаны все публикации автора до номера')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор поста')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='author_read_watermarks', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Граница прочтения автора',
+                'verbose_name_plural': 'Границы прочтения авторов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='authorreadwatermark',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_author_read_watermark'),
+        ),
+    ]
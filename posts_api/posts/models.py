@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -13,11 +14,22 @@ class Post(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='posts'
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'), name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date'), name='post_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -40,6 +52,11 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'following'), name='unique_follow'
+            )
+        ]
 
     def __str__(self):
         return f'Пользователь {self.user} подписан на {self.following}'
@@ -58,17 +75,222 @@ class ReadStatus(models.Model):
         on_delete=models.CASCADE,
         related_name='posts_read_by_users'
     )
+    # False — исключение: публикация ниже границы прочтения не прочитана.
+    read = models.BooleanField('Прочитана', default=True)
 
     class Meta:
         verbose_name = 'Прочитанная публикация'
         verbose_name_plural = 'Прочитанные публикации'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_read_status'
+            )
+        ]
 
     def __str__(self):
         return f'Пользователь {self.user} прочитал публикацию №{self.post}'
 
 
-@receiver(post_save, sender=Post)
-def signal_handler(sender, instance, **kwargs):
-    ReadStatus.objects.create(
-        post=instance, user=instance.author
+class ReadWatermark(models.Model):
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='read_watermark'
+    )
+    watermark = models.BigIntegerField(
+        'Прочитаны все публикации до номера', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Граница прочтения'
+        verbose_name_plural = 'Границы прочтения'
+
+    def __str__(self):
+        return (
+            f'Пользователь {self.user} прочитал публикации '
+            f'до №{self.watermark}'
+        )
+
+
+class AuthorReadWatermark(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='author_read_watermarks'
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор поста',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    watermark = models.BigIntegerField(
+        'Прочитаны все публикации автора до номера', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Граница прочтения автора'
+        verbose_name_plural = 'Границы прочтения авторов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_author_read_watermark'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'Пользователь {self.user} прочитал публикации {self.author} '
+            f'до №{self.watermark}'
+        )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Публикация',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_pub_date_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'Публикация №{self.post_id} в ленте {self.user}'
+
+
+class UnreadCounter(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='unread_counters'
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор поста',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    count = models.PositiveIntegerField('Непрочитанных публикаций', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчик непрочитанных'
+        verbose_name_plural = 'Счетчики непрочитанных'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_unread_counter'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'Пользователь {self.user}: {self.count} непрочитанных '
+            f'публикаций {self.author}'
+        )
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
     )
+    posts_count = models.PositiveIntegerField(
+        'Количество публикаций', default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок', default=0
+    )
+    fanned_out = models.BooleanField(
+        'Публикации раскладываются по лентам', default=True
+    )
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+        indexes = [
+            models.Index(
+                fields=('posts_count', 'user'), name='stats_posts_count_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'Статистика пользователя {self.user}'
+
+
+class Change(models.Model):
+    POST = 'post'
+    FOLLOW = 'follow'
+    KINDS = (
+        (POST, 'Публикация'),
+        (FOLLOW, 'Подписка'),
+    )
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = (
+        (CREATED, 'Создание'),
+        (UPDATED, 'Изменение'),
+        (DELETED, 'Удаление'),
+    )
+
+    kind = models.CharField('Тип объекта', max_length=16, choices=KINDS)
+    action = models.CharField('Действие', max_length=16, choices=ACTIONS)
+    object_id = models.BigIntegerField('Номер объекта')
+    # Без внешнего ключа: запись об удалении подписки переживает
+    # удаление её владельца.
+    user_id = models.BigIntegerField(
+        'Номер владельца подписки', null=True, blank=True
+    )
+    created = models.DateTimeField('Дата изменения', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+        indexes = [
+            models.Index(fields=('kind', 'id'), name='change_kind_idx'),
+            models.Index(
+                fields=('user_id', 'kind', 'id'),
+                name='change_user_kind_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.get_action_display()}: {self.kind} №{self.object_id}'
+
+
+@receiver(post_save, sender=Post)
+def signal_handler(sender, instance, created, **kwargs):
+    if created:
+        ReadStatus.objects.create(
+            post=instance, user=instance.author
+        )
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import select
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Follow, Post
+from .signals import posts_bulk_created
+
+logger = logging.getLogger(__name__)
+
+STREAM_LIMIT = 100
+
+STREAM_LAG = getattr(settings, 'POSTS_SYNC_LAG', 2)
+
+
+def wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class LocalBroker:
+    """Оповещения о новых постах внутри процесса.
+
+    Хранит номера последних событий с авторами постов. Ожидающие запросы
+    просыпаются по событию от автора из своих подписок и перечитывают
+    ленту из базы, поэтому потеря события стоит лишь задержки до конца
+    таймаута. Событие без автора будит всех.
+    """
+    history = 1000
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.events = deque(maxlen=self.history)
+        self.waiters = set()
+
+    def position(self):
+        with self.condition:
+            return self.sequence
+
+    def publish(self, author_id):
+        with self.condition:
+            self.sequence += 1
+            self.events.append((self.sequence, author_id))
+            self.condition.notify_all()
+            for loop, waiter in self.waiters:
+                loop.call_soon_threadsafe(wake, waiter)
+
+    def send(self, author_id):
+        transaction.on_commit(lambda: self.publish(author_id))
+
+    def has_events(self, author_ids, position):
+        if self.events and self.events[0][0] > position + 1:
+            return True
+        return any(
+            sequence > position
+            and (author_id is None or author_id in author_ids)
+            for sequence, author_id in self.events
+        )
+
+    def wait(self, author_ids, timeout, position):
+        author_ids = set(author_ids)
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not self.has_events(author_ids, position):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    async def wait_async(self, author_ids, timeout, position):
+        """Как wait, но ждет в цикле событий, не занимая поток."""
+        author_ids = set(author_ids)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            waiter = (loop, loop.create_future())
+            with self.condition:
+                if self.has_events(author_ids, position):
+                    return True
+                self.waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], deadline - loop.time())
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                with self.condition:
+                    self.waiters.discard(waiter)
+
+
+class PostgresBroker(LocalBroker):
+    """Оповещения между процессами через LISTEN/NOTIFY PostgreSQL.
+
+    NOTIFY отправляется в транзакции создания поста и доставляется после
+    её фиксации. Каждый процесс слушает канал в отдельном потоке со своим
+    соединением и передает события в локального брокера.
+    """
+    channel = 'posts_new'
+    poll_interval = 5
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def send(self, author_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)', [self.channel, str(author_id)]
+            )
+
+    def wait(self, author_ids, timeout, position):
+        self.start_listener()
+        return super().wait(author_ids, timeout, position)
+
+    async def wait_async(self, author_ids, timeout, position):
+        self.start_listener()
+        return await super().wait_async(author_ids, timeout, position)
+
+    def start_listener(self):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(
+                    target=self.listen, name='posts-listen', daemon=True
+                )
+                self.listener.start()
+
+    def listen(self):
+        import psycopg2
+
+        while True:
+            try:
+                self.consume(psycopg2.connect(
+                    **connections['default'].get_connection_params()
+                ))
+            except psycopg2.Error:
+                logger.exception('Соединение LISTEN потеряно.')
+                time.sleep(1)
+            # Пока соединения не было, события могли быть пропущены.
+            self.publish(None)
+
+    def consume(self, pg_connection):
+        try:
+            pg_connection.autocommit = True
+            with pg_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            while True:
+                ready, _, _ = select.select(
+                    [pg_connection], [], [], self.poll_interval
+                )
+                if not ready:
+                    continue
+                pg_connection.poll()
+                while pg_connection.notifies:
+                    notify = pg_connection.notifies.pop(0)
+                    self.publish(int(notify.payload))
+        finally:
+            pg_connection.close()
+
+
+broker = import_string(
+    getattr(settings, 'POSTS_STREAM_BACKEND', 'posts.pubsub.LocalBroker')
+)()
+
+
+def settled(posts):
+    """Посты старше POSTS_SYNC_LAG секунд.
+
+    Номера постов выдаются до фиксации транзакций, поэтому пост из еще
+    не зафиксированной транзакции может появиться позади уже выданного
+    курсора, как и в changes_since.
+    """
+    return posts.filter(
+        pub_date__lte=timezone.now() - timedelta(seconds=STREAM_LAG)
+    )
+
+
+def new_post_ids(posts, since):
+    return list(settled(posts).filter(pk__gt=since).order_by(
+        'id'
+    ).values_list('id', flat=True)[:STREAM_LIMIT])
+
+
+def last_post_id(posts):
+    return settled(posts).order_by('-id').values_list(
+        'id', flat=True
+    ).first() or 0
+
+
+def poll_posts(posts, since):
+    """Готовые к отдаче посты новее since и есть ли среди новых свежие."""
+    post_ids = new_post_ids(posts, since)
+    pending = not post_ids and posts.filter(pk__gt=since).exists()
+    return post_ids, pending
+
+
+def followed_author_ids(user):
+    return list(Follow.objects.filter(
+        user=user
+    ).values_list('following_id', flat=True))
+
+
+def release_connection():
+    for db in connections.all():
+        if not db.in_atomic_block:
+            # Не держим соединения с базой, пока ждем.
+            db.close()
+
+
+def in_thread(func):
+    """Асинхронная обертка func, выполняемой вне цикла событий.
+
+    После вызова соединение потока закрывается, чтобы ожидающие
+    запросы не держали соединения с базой.
+    """
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            release_connection()
+
+    return sync_to_async(call, thread_sensitive=False)
+
+
+def wait_for_posts(user, posts, since, timeout):
+    """Номера постов из ленты posts новее since.
+
+    Если таких нет, ждет до timeout секунд поста от автора из подписок
+    пользователя. Свежие посты отдаются, когда станут старше
+    POSTS_SYNC_LAG секунд.
+    """
+    deadline = time.monotonic() + timeout
+    author_ids = None
+    while True:
+        position = broker.position()
+        post_ids, pending = poll_posts(posts, since)
+        remaining = deadline - time.monotonic()
+        if post_ids or remaining <= 0:
+            return post_ids
+        if author_ids is None and not pending:
+            author_ids = followed_author_ids(user)
+        release_connection()
+        if pending:
+            time.sleep(min(STREAM_LAG, remaining))
+        elif not broker.wait(author_ids, remaining, position):
+            return []
+
+
+async def wait_for_posts_async(user, posts, since, timeout):
+    """wait_for_posts для ASGI.
+
+    Запросы к базе идут в потоках, а ожидание — в цикле событий, поэтому
+    открытые long-poll и SSE не занимают потоков.
+    """
+    deadline = time.monotonic() + timeout
+    author_ids = None
+    while True:
+        position = broker.position()
+        post_ids, pending = await in_thread(poll_posts)(posts, since)
+        remaining = deadline - time.monotonic()
+        if post_ids or remaining <= 0:
+            return post_ids
+        if pending:
+            await asyncio.sleep(min(STREAM_LAG, remaining))
+            continue
+        if author_ids is None:
+            author_ids = await in_thread(followed_author_ids)(user)
+        if not await broker.wait_async(author_ids, remaining, position):
+            return []
+
+
+@receiver(post_save, sender=Post)
+def post_created_handler(sender, instance, created, **kwargs):
+    if created:
+        broker.send(instance.author_id)
+
+
+@receiver(posts_bulk_created, sender=Post)
+def posts_bulk_created_handler(sender, author_id, **kwargs):
+    broker.send(author_id)
@@ -0,0 +1,227 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from .models import (AuthorReadWatermark, Post, ReadStatus, ReadWatermark,
+                     User)
+from .signals import read_marks_buffered, read_status_changed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def insert_read_pairs(pairs):
+    """Вставляет отметки (user_id, post_id) одним запросом на пачку.
+
+    Отметки удаленных постов и постов не выше общей границы прочтения
+    или границы автора пропускаются, кроме исключений под границами: они
+    становятся прочитанными. Возвращает впервые отмеченные пары.
+    """
+    connection = connections[router.db_for_write(ReadStatus)]
+    quote_name = connection.ops.quote_name
+    inserted = []
+    for start in range(0, len(pairs), BATCH_SIZE):
+        batch = pairs[start:start + BATCH_SIZE]
+        # Столбцы VALUES и в PostgreSQL, и в SQLite называются column1,
+        # column2.
+        sql = (
+            'INSERT INTO {table} ({user}, {post}, {read}) '
+            'SELECT marked.column1, marked.column2, %s '
+            'FROM ({values}) marked '
+            'INNER JOIN {posts} ON {posts}.{id} = marked.column2 '
+            'LEFT OUTER JOIN {watermarks} '
+            'ON {watermarks}.{user} = marked.column1 '
+            'WHERE (marked.column2 > COALESCE({watermarks}.{watermark}, 0) '
+            'AND NOT EXISTS (SELECT 1 FROM {author_watermarks} covered '
+            'WHERE covered.{user} = marked.column1 '
+            'AND covered.{author} = {posts}.{author} '
+            'AND covered.{watermark} >= marked.column2)) '
+            'OR EXISTS (SELECT 1 FROM {table} unread '
+            'WHERE unread.{user} = marked.column1 '
+            'AND unread.{post} = marked.column2 AND NOT unread.{read}) '
+            'ON CONFLICT ({user}, {post}) DO UPDATE SET {read} = %s '
+            'WHERE NOT {table}.{read} '
+            'RETURNING {user}, {post}'
+        ).format(
+            table=quote_name(ReadStatus._meta.db_table),
+            posts=quote_name(Post._meta.db_table),
+            watermarks=quote_name(ReadWatermark._meta.db_table),
+            author_watermarks=quote_name(AuthorReadWatermark._meta.db_table),
+            user=quote_name('user_id'),
+            author=quote_name('author_id'),
+            post=quote_name('post_id'),
+            id=quote_name('id'),
+            read=quote_name('read'),
+            watermark=quote_name('watermark'),
+            values='VALUES ' + ', '.join(['(%s, %s)'] * len(batch)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                True, *(value for pair in batch for value in pair), True
+            ])
+            inserted.extend(cursor.fetchall())
+    return inserted
+
+
+class ReadMarkBuffer:
+    """Отложенная запись отметок о прочтении.
+
+    Отметки копятся в памяти процесса и записываются пачкой, когда их
+    набирается max_size или с прошлой записи прошло interval секунд.
+    Пока отметка не записана, pending возвращает её для своего
+    пользователя. Вместе с отметками откладываются и сигналы об уже
+    записанных отметках. При штатном завершении процесса буфер
+    записывается.
+    """
+
+    def __init__(self, max_size, interval):
+        self.max_size = max_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.marks = defaultdict(set)
+        self.changes = defaultdict(set)
+        self.flushing = {}
+        self.size = 0
+        self.flushed_at = time.monotonic()
+        self.timer = None
+
+    def add(self, user, post_id):
+        with self.lock:
+            if post_id in self.marks[user.pk]:
+                return
+            self.marks[user.pk].add(post_id)
+            self.size += 1
+            due = (
+                self.size >= self.max_size
+                or time.monotonic() - self.flushed_at >= self.interval
+            )
+        read_marks_buffered.send(
+            sender=ReadStatus, user=user, post_ids=[post_id]
+        )
+        if due:
+            self.flush()
+        else:
+            self.start_timer()
+
+    def defer_changes(self, user, post_ids):
+        """Откладывает read_status_changed для записанных в базу отметок.
+
+        После фиксации транзакции сигнал ждет следующей записи буфера и
+        уходит одним на пользователя, поэтому счетчики непрочитанных
+        обновляются пачкой, а не в запросе просмотра поста. Читающие
+        счетчики сначала записывают буфер.
+        """
+        read_marks_buffered.send(
+            sender=ReadStatus, user=user, post_ids=post_ids
+        )
+        transaction.on_commit(lambda: self.add_changes(user.pk, post_ids))
+
+    def add_changes(self, user_id, post_ids):
+        with self.lock:
+            self.changes[user_id].update(post_ids)
+            self.size += len(post_ids)
+            due = self.size >= self.max_size
+        if due:
+            self.flush()
+
+    def pending(self, user, post_ids):
+        with self.lock:
+            marks = self.marks.get(user.pk, set()) | self.flushing.get(
+                user.pk, set()
+            )
+        return marks.intersection(post_ids)
+
+    def discard(self, user, post_ids):
+        # Ждет идущую запись: иначе снятые отметки она бы еще записала.
+        with self.flush_lock, self.lock:
+            marks = self.marks.get(user.pk)
+            if marks:
+                self.size -= len(marks.intersection(post_ids))
+                marks.difference_update(post_ids)
+
+    def forget_changes(self, user):
+        """Отбрасывает отложенные сигналы перед пересчетом по базе."""
+        with self.flush_lock, self.lock:
+            self.size -= len(self.changes.pop(user.pk, ()))
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                marks = {
+                    user_id: post_ids
+                    for user_id, post_ids in self.marks.items() if post_ids
+                }
+                self.flushing = marks
+                self.marks = defaultdict(set)
+                changes, self.changes = self.changes, defaultdict(set)
+                self.size = 0
+                self.flushed_at = time.monotonic()
+            try:
+                if marks or changes:
+                    self.write(marks, changes)
+            except Exception:
+                # Отметки вернутся в буфер и будут записаны в следующий раз.
+                with self.lock:
+                    for pending, restored in (
+                        (self.marks, marks), (self.changes, changes)
+                    ):
+                        for user_id, post_ids in restored.items():
+                            self.size += len(post_ids - pending[user_id])
+                            pending[user_id].update(post_ids)
+                raise
+            finally:
+                with self.lock:
+                    self.flushing = {}
+
+    def write(self, marks, changes):
+        by_user = defaultdict(set)
+        for user_id, post_ids in changes.items():
+            by_user[user_id].update(post_ids)
+        if marks:
+            with transaction.atomic():
+                inserted = insert_read_pairs(sorted(
+                    (user_id, post_id)
+                    for user_id, post_ids in marks.items()
+                    for post_id in post_ids
+                ))
+            for user_id, post_id in inserted:
+                by_user[user_id].add(post_id)
+        for user in User.objects.filter(pk__in=list(by_user)):
+            read_status_changed.send(
+                sender=ReadStatus, user=user,
+                post_ids=sorted(by_user[user.pk])
+            )
+
+    def start_timer(self):
+        with self.lock:
+            if self.timer is not None:
+                return
+            self.timer = threading.Thread(
+                target=self.run_timer, name='read-marks-flush', daemon=True
+            )
+            self.timer.start()
+
+    def run_timer(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать отметки о прочтении.')
+            finally:
+                # Соединение потока не закрывается обработчиками запросов.
+                connections.close_all()
+
+
+read_buffer = ReadMarkBuffer(
+    getattr(settings, 'READ_STATUS_BUFFER_SIZE', 1000),
+    getattr(settings, 'READ_STATUS_FLUSH_INTERVAL', 1),
+)
+atexit.register(read_buffer.flush)
@@ -0,0 +1,308 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import (BooleanField, Case, Exists, Max, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AuthorReadWatermark, Post, ReadStatus, ReadWatermark
+from .read_buffer import read_buffer
+from .signals import read_status_changed
+
+COMPACTION_DELAY = timedelta(
+    seconds=getattr(settings, 'READ_STATUS_COMPACTION_DELAY', 60)
+)
+
+WRITE_BEHIND = getattr(settings, 'READ_STATUS_WRITE_BEHIND', False)
+
+BATCH_SIZE = 1000
+
+
+def get_watermark(user):
+    watermark = ReadWatermark.objects.filter(user=user).values_list(
+        'watermark', flat=True
+    ).first()
+    return watermark or 0
+
+
+def lock_watermark(user):
+    """Блокирует границу прочтения до конца транзакции и возвращает её."""
+    ReadWatermark.objects.get_or_create(user=user)
+    return ReadWatermark.objects.select_for_update().values_list(
+        'watermark', flat=True
+    ).get(user=user)
+
+
+def covered_by_watermark(user):
+    """Условие на посты не выше общей границы или границы их автора."""
+    watermark = ReadWatermark.objects.filter(user=user).values('watermark')
+    author_watermarks = AuthorReadWatermark.objects.filter(
+        user=user, author=OuterRef('author_id'), watermark__gte=OuterRef('pk')
+    )
+    return (
+        Q(pk__lte=Coalesce(Subquery(watermark), Value(0)))
+        | Q(Exists(author_watermarks))
+    )
+
+
+def read_post_ids(user, post_ids):
+    """Возвращает множество прочитанных пользователем постов из post_ids.
+
+    Все посты не выше общей границы прочтения или границы своего автора
+    считаются прочитанными, кроме исключений — строк ReadStatus с
+    read=False. Выше границ прочитаны посты со строкой ReadStatus.
+    Учитываются и отметки, еще не записанные из буфера.
+    """
+    post_ids = set(post_ids)
+    if not post_ids:
+        return set()
+    rows = annotate_read_status(
+        user, Post.objects.filter(pk__in=post_ids)
+    ).values_list('pk', 'read_status')
+    read_ids = {post_id for post_id, read in rows if read}
+    read_ids.update(read_buffer.pending(user, post_ids - read_ids))
+    return read_ids
+
+
+def unread_posts(user):
+    marks = ReadStatus.objects.filter(user=user)
+    read_ids = marks.filter(read=True).values('post_id')
+    unread_ids = marks.filter(read=False).values('post_id')
+    return Post.objects.filter(
+        ~covered_by_watermark(user) & ~Q(pk__in=read_ids)
+        | Q(pk__in=unread_ids)
+    )
+
+
+def annotate_read_status(user, queryset):
+    """Вычисляет read_status в том же запросе, что и сами посты."""
+    marks = ReadStatus.objects.filter(user=user, post=OuterRef('pk'))
+    return queryset.annotate(read_status=Coalesce(
+        Subquery(marks.values('read')),
+        Case(
+            When(covered_by_watermark(user), then=Value(True)),
+            default=Value(False),
+        ),
+        output_field=BooleanField(),
+    ))
+
+
+def attach_read_status(user, posts):
+    posts = [post for post in posts if 'read_status' not in post.__dict__]
+    read_ids = read_post_ids(user, [post.pk for post in posts])
+    for post in posts:
+        post.read_status = post.pk in read_ids
+
+
+def insert_read_marks(user, posts):
+    """Отмечает посты из queryset прочитанными одним запросом.
+
+    Вставка идёт через INSERT ... SELECT ... ON CONFLICT, поэтому
+    повторные и конкурентные отметки не создают дубликатов, а
+    исключения под границами прочтения становятся прочитанными. Прочие
+    посты не выше общей границы или границы своего автора уже прочитаны
+    и пропускаются. Возвращает номера постов, отмеченных впервые.
+    """
+    connection = connections[router.db_for_write(ReadStatus)]
+    quote_name = connection.ops.quote_name
+    select_sql, params = posts.order_by().values(
+        'id', 'author_id'
+    ).query.get_compiler(connection=connection).as_sql()
+    sql = (
+        'INSERT INTO {table} ({user}, {post}, {read}) '
+        'SELECT %s, marked.id, %s FROM ({select}) marked '
+        'WHERE (marked.id > COALESCE(('
+        'SELECT {watermark} FROM {watermarks} WHERE {user} = %s'
+        '), 0) AND NOT EXISTS ('
+        'SELECT 1 FROM {author_watermarks} WHERE {user} = %s '
+        'AND {author} = marked.{author} AND {watermark} >= marked.id'
+        ')) OR marked.id IN ('
+        'SELECT {post} FROM {table} WHERE {user} = %s AND NOT {read}'
+        ') '
+        'ON CONFLICT ({user}, {post}) DO UPDATE SET {read} = %s '
+        'WHERE NOT {table}.{read} RETURNING {post}'
+    ).format(
+        table=quote_name(ReadStatus._meta.db_table),
+        watermarks=quote_name(ReadWatermark._meta.db_table),
+        author_watermarks=quote_name(AuthorReadWatermark._meta.db_table),
+        watermark=quote_name('watermark'),
+        user=quote_name('user_id'),
+        post=quote_name('post_id'),
+        author=quote_name('author_id'),
+        read=quote_name('read'),
+        select=select_sql,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (
+            user.pk, True, *params, user.pk, user.pk, user.pk, True
+        ))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def mark_read(user, posts):
+    inserted = insert_read_marks(user, posts)
+    if inserted:
+        read_status_changed.send(
+            sender=ReadStatus, user=user, post_ids=inserted
+        )
+    return inserted
+
+
+def mark_post_read(user, post_id):
+    """Отметка о просмотре поста.
+
+    При READ_STATUS_WRITE_BEHIND отметка ставится в буфер и пишется в
+    базу пачкой вместе с другими. Иначе она пишется сразу, а счетчики
+    непрочитанных обновляются при записи буфера.
+    """
+    if WRITE_BEHIND:
+        read_buffer.add(user, post_id)
+        return
+    inserted = insert_read_marks(user, Post.objects.filter(pk=post_id))
+    if inserted:
+        read_buffer.defer_changes(user, inserted)
+
+
+def bulk_mark_read(user, post_ids):
+    return len(mark_read(user, Post.objects.filter(pk__in=post_ids)))
+
+
+def mark_read_up_to(user, post_id):
+    """Отмечает прочитанными все посты с номером не больше post_id.
+
+    Граница не поднимается выше последнего существующего поста, иначе
+    будущие публикации сразу оказались бы прочитанными. Границы авторов
+    не выше новой границы больше не нужны и удаляются.
+    """
+    post_id = Post.objects.filter(pk__lte=post_id).aggregate(
+        last=Max('id')
+    )['last'] or 0
+    with transaction.atomic():
+        watermark = lock_watermark(user)
+        changed = unread_posts(user).filter(pk__lte=post_id).count()
+        if post_id > watermark:
+            ReadWatermark.objects.filter(user=user).update(
+                watermark=post_id
+            )
+        ReadStatus.objects.filter(user=user, post_id__lte=post_id).delete()
+        AuthorReadWatermark.objects.filter(
+            user=user, watermark__lte=post_id
+        ).delete()
+    if changed:
+        read_buffer.forget_changes(user)
+        read_status_changed.send(sender=ReadStatus, user=user, post_ids=None)
+    return changed
+
+
+def bulk_mark_unread(user, post_ids):
+    """Снимает отметки о прочтении.
+
+    Посты под границами прочтения получают исключения — строки
+    ReadStatus с read=False, а границы не меняются. Поэтому число строк
+    растет только на число снятых отметок, как бы далеко ни были
+    границы.
+    """
+    post_ids = set(Post.objects.filter(
+        pk__in=post_ids
+    ).values_list('pk', flat=True))
+    read_buffer.discard(user, post_ids)
+    with transaction.atomic():
+        lock_watermark(user)
+        below = set(Post.objects.filter(
+            covered_by_watermark(user), pk__in=post_ids
+        ).values_list('pk', flat=True))
+        marks = dict(ReadStatus.objects.filter(
+            user=user, post_id__in=below
+        ).values_list('post_id', 'read'))
+        ReadStatus.objects.filter(
+            user=user, post_id__in=below, read=True
+        ).update(read=False)
+        ReadStatus.objects.bulk_create([
+            ReadStatus(user=user, post_id=post_id, read=False)
+            for post_id in below - marks.keys()
+        ], ignore_conflicts=True)
+        changed, _ = ReadStatus.objects.filter(
+            user=user, post_id__in=post_ids - below
+        ).delete()
+    changed += sum(marks.get(post_id, True) for post_id in below)
+    if changed:
+        read_buffer.forget_changes(user)
+        read_status_changed.send(sender=ReadStatus, user=user, post_ids=None)
+    return changed
+
+
+def compaction_limit(posts, read_ids):
+    """Номер, до которого границу можно поднять по постам posts выше неё.
+
+    Граница останавливается перед первым непрочитанным постом и перед
+    свежими: их номера могут быть выданы транзакциями, которые ещё не
+    завершились. Возвращает None, если постов нет.
+    """
+    posts = posts.order_by('id')
+    first_unread = posts.exclude(id__in=read_ids).values_list(
+        'id', flat=True
+    ).first()
+    first_fresh = posts.filter(
+        pub_date__gt=timezone.now() - COMPACTION_DELAY
+    ).values_list('id', flat=True).first()
+    limits = [
+        post_id - 1 for post_id in (first_unread, first_fresh)
+        if post_id is not None
+    ]
+    if limits:
+        return min(limits)
+    return posts.aggregate(last=Max('id'))['last']
+
+
+def compact(user):
+    """Поднимает границы прочтения и удаляет покрытые ими строки.
+
+    Общая граница доходит только до первого непрочитанного поста на
+    всем сайте, и у пользователя, читающего одну свою ленту, почти не
+    двигается. Поэтому для каждого автора с отметками поднимается и
+    граница этого автора: подряд прочитанные посты автора сжимаются в
+    одну строку. Исключения под границами остаются. Подсчёт идёт под
+    блокировкой общей границы, чтобы не пересечься с mark_read_up_to
+    и bulk_mark_unread.
+    """
+    read_marks = ReadStatus.objects.filter(user=user, read=True)
+    read_ids = read_marks.values('post_id')
+    with transaction.atomic():
+        watermark = lock_watermark(user)
+        limit = compaction_limit(
+            Post.objects.filter(id__gt=watermark), read_ids
+        )
+        if limit is not None and limit > watermark:
+            watermark = limit
+            ReadWatermark.objects.filter(user=user).update(
+                watermark=watermark
+            )
+            read_marks.filter(post_id__lte=watermark).delete()
+            AuthorReadWatermark.objects.filter(
+                user=user, watermark__lte=watermark
+            ).delete()
+        author_watermarks = dict(AuthorReadWatermark.objects.filter(
+            user=user
+        ).values_list('author_id', 'watermark'))
+        author_ids = read_marks.values_list(
+            'post__author_id', flat=True
+        ).order_by().distinct()
+        for author_id in author_ids:
+            start = max(watermark, author_watermarks.get(author_id, 0))
+            limit = compaction_limit(
+                Post.objects.filter(author_id=author_id, id__gt=start),
+                read_ids
+            )
+            if limit is None or limit <= start:
+                continue
+            deleted, _ = read_marks.filter(
+                post__author_id=author_id, post_id__lte=limit
+            ).delete()
+            if deleted:
+                AuthorReadWatermark.objects.update_or_create(
+                    user=user, author_id=author_id,
+                    defaults={'watermark': limit}
+                )
+    return watermark
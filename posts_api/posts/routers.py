@@ -0,0 +1,98 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+
+PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+PIN_CACHE_ALIAS = getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')
+
+routing = ContextVar('routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, user_id, pinned):
+        self.user_id = user_id
+        self.pinned = pinned
+        self.wrote = False
+        self.used_replica = False
+
+
+def pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+def pick_replica():
+    return random.choice(REPLICAS)
+
+
+def start_routing(user, replica_reads):
+    """Включает маршрутизацию запроса пользователя до stop_routing.
+
+    При replica_reads чтение идет с реплик, если пользователь не писал в
+    базу последние REPLICA_PIN_SECONDS секунд: иначе он мог бы не увидеть
+    свои изменения. Запись в ходе запроса закрепляет пользователя за
+    основной базой. Без реплик возвращает None.
+    """
+    if not REPLICAS:
+        return None
+    pinned = not replica_reads or (
+        user.pk is not None
+        and caches[PIN_CACHE_ALIAS].get(pin_key(user.pk)) is not None
+    )
+    return routing.set(RoutingState(user.pk, pinned))
+
+
+def stop_routing(token):
+    routing.reset(token)
+
+
+def replica_may_lag(timestamp):
+    """Могла ли реплика еще не получить изменение, сделанное в timestamp."""
+    state = routing.get()
+    return (
+        state is not None
+        and state.used_replica
+        and time.time() - timestamp < PIN_SECONDS
+    )
+
+
+class ReplicaRouter:
+    """Чтение с реплик в разрешенных запросах, запись в основную базу.
+
+    После записи пользователь закрепляется за основной базой до конца
+    запроса и на REPLICA_PIN_SECONDS секунд после него.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is None or state.pinned:
+            return None
+        state.used_replica = True
+        return pick_replica()
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None and not state.wrote:
+            state.wrote = state.pinned = True
+            if state.user_id is not None:
+                caches[PIN_CACHE_ALIAS].set(
+                    pin_key(state.user_id), 1, PIN_SECONDS
+                )
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in REPLICAS:
+            return False
+        return None
@@ -0,0 +1,22 @@
+from django.dispatch import Signal
+
+# Отправляется после изменения отметок о прочтении пользователя.
+# Аргументы: user, post_ids — номера впервые прочитанных постов или None,
+# если изменения нельзя выразить списком и производные данные нужно
+# пересчитать.
+read_status_changed = Signal()
+
+# Отправляется, когда отметки о прочтении видны пользователю, а
+# read_status_changed для них отложен до записи буфера. Аргументы:
+# user, post_ids.
+read_marks_buffered = Signal()
+
+# Отправляются после массовой вставки через bulk_create, которая не
+# вызывает post_save. Аргументы posts_bulk_created: author_id, posts.
+# Аргументы follows_bulk_created: user_id, following_ids, follows.
+posts_bulk_created = Signal()
+follows_bulk_created = Signal()
+
+# Отправляется, когда посты автора снова раскладываются по лентам
+# подписчиков. Аргументы: author_id.
+fanout_resumed = Signal()
@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow, Post, User, UserStats
+from .signals import follows_bulk_created, posts_bulk_created
+
+
+def _count(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by(
+    ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def rebuild_stats(user_ids=None):
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    rows = users.annotate(
+        stats_posts=_count(Post, 'author'),
+        stats_followers=_count(Follow, 'following'),
+        stats_following=_count(Follow, 'user'),
+    ).values_list('pk', 'stats_posts', 'stats_followers', 'stats_following')
+    with transaction.atomic():
+        stats = UserStats.objects.all()
+        if user_ids is not None:
+            stats = stats.filter(user_id__in=user_ids)
+        # Состояние раскладки по лентам не выводится из счетчиков.
+        merged = set(stats.filter(fanned_out=False).values_list(
+            'user_id', flat=True
+        ))
+        stats.delete()
+        UserStats.objects.bulk_create(
+            [
+                UserStats(
+                    user_id=user_id,
+                    posts_count=posts_count,
+                    followers_count=followers_count,
+                    following_count=following_count,
+                    fanned_out=user_id not in merged,
+                )
+                for user_id, posts_count, followers_count, following_count
+                in rows
+            ],
+            batch_size=1000,
+        )
+
+
+def change_stats(user_id, field, delta):
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    updated = stats.update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        rebuild_stats([user_id])
+
+
+@receiver(post_save, sender=User)
+def create_stats_handler(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created_handler(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_handler(sender, instance, **kwargs):
+    change_stats(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created_handler(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.user_id, 'following_count', 1)
+        change_stats(instance.following_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted_handler(sender, instance, **kwargs):
+    change_stats(instance.user_id, 'following_count', -1)
+    change_stats(instance.following_id, 'followers_count', -1)
+
+
+@receiver(posts_bulk_created, sender=Post)
+def posts_bulk_created_handler(sender, author_id, posts, **kwargs):
+    change_stats(author_id, 'posts_count', len(posts))
+
+
+@receiver(follows_bulk_created, sender=Follow)
+def follows_bulk_created_handler(sender, user_id, following_ids, **kwargs):
+    change_stats(user_id, 'following_count', len(following_ids))
+    stats = UserStats.objects.filter(user_id__in=following_ids)
+    updated = stats.update(followers_count=F('followers_count') + 1)
+    if updated < len(following_ids):
+        rebuild_stats(
+            set(following_ids) - set(stats.values_list('user_id', flat=True))
+        )
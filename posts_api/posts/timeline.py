@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .signals import fanout_resumed, follows_bulk_created, posts_bulk_created
+
+FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+
+FANOUT_RESUME_LIMIT = getattr(
+    settings, 'TIMELINE_FANOUT_RESUME_LIMIT', FANOUT_LIMIT * 9 // 10
+)
+
+BATCH_SIZE = 1000
+
+
+def is_fanned_out(author_id):
+    """Посты автора раскладываются по лентам подписчиков при записи.
+
+    Раскладка прекращается, когда у автора становится больше
+    TIMELINE_FANOUT_LIMIT подписчиков, и возобновляется, только когда их
+    остается не больше TIMELINE_FANOUT_RESUME_LIMIT. Посты авторов без
+    раскладки подмешиваются при чтении.
+    """
+    fanned_out = UserStats.objects.filter(user_id=author_id).values_list(
+        'fanned_out', flat=True
+    ).first()
+    if fanned_out is None:
+        return (
+            Follow.objects.filter(following_id=author_id).count()
+            <= FANOUT_LIMIT
+        )
+    return fanned_out
+
+
+def stop_fanout(author_ids):
+    UserStats.objects.filter(
+        user_id__in=author_ids,
+        fanned_out=True,
+        followers_count__gt=FANOUT_LIMIT
+    ).update(fanned_out=False)
+
+
+def resume_fanout(author_id):
+    with transaction.atomic():
+        resumed = UserStats.objects.filter(
+            user_id=author_id,
+            fanned_out=False,
+            followers_count__lte=FANOUT_RESUME_LIMIT
+        ).update(fanned_out=True)
+        if resumed:
+            rebuild_author(author_id)
+            fanout_resumed.send(sender=UserStats, author_id=author_id)
+
+
+def push_entries(user_ids, posts):
+    """Записывает в ленты user_ids посты из пар (номер, дата)."""
+    entries = [
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id in user_ids
+        for post_id, pub_date in posts
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def push_posts(author_id, posts):
+    if not is_fanned_out(author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        following_id=author_id
+    ).values_list('user_id', flat=True)
+    push_entries(list(follower_ids), posts)
+
+
+def push_post(post):
+    push_posts(post.author_id, [(post.pk, post.pub_date)])
+
+
+def backfill(user_id, author_id):
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    push_entries([user_id], posts)
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild_author(author_id):
+    follower_ids = Follow.objects.filter(
+        following_id=author_id
+    ).values_list('user_id', flat=True)
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    push_entries(list(follower_ids), list(posts))
+
+
+def feed_parts(user):
+    """Запросы ленты: посты авторов без раскладки и записи ленты.
+
+    Первый читается по индексу (author, -pub_date), второй — по индексу
+    (user, -pub_date, -post), поэтому страницу ленты можно выбрать из
+    каждого отдельно и объединить через UNION.
+    """
+    merged_authors = Follow.objects.filter(
+        user=user, following__stats__fanned_out=False
+    ).values('following_id')
+    return (
+        Post.objects.filter(author_id__in=merged_authors),
+        TimelineEntry.objects.filter(user=user),
+    )
+
+
+def feed_queryset(user):
+    merged, timeline = feed_parts(user)
+    return Post.objects.filter(pk__in=merged.order_by().values('id').union(
+        timeline.values('post_id')
+    ))
+
+
+@receiver(post_save, sender=Post)
+def push_post_handler(sender, instance, created, **kwargs):
+    if created:
+        push_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_handler(sender, instance, created, **kwargs):
+    if not created:
+        return
+    stop_fanout([instance.following_id])
+    if is_fanned_out(instance.following_id):
+        backfill(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_handler(sender, instance, **kwargs):
+    prune(instance.user_id, instance.following_id)
+    resume_fanout(instance.following_id)
+
+
+@receiver(posts_bulk_created, sender=Post)
+def push_posts_handler(sender, author_id, posts, **kwargs):
+    push_posts(author_id, [(post.pk, post.pub_date) for post in posts])
+
+
+@receiver(follows_bulk_created, sender=Follow)
+def bulk_backfill_handler(sender, user_id, following_ids, **kwargs):
+    stop_fanout(following_ids)
+    fanned_out = UserStats.objects.filter(
+        user_id__in=following_ids, fanned_out=True
+    ).values('user_id')
+    push_entries([user_id], Post.objects.filter(
+        author_id__in=fanned_out
+    ).values_list('id', 'pub_date'))
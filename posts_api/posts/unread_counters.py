@@ -0,0 +1,192 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import (AuthorReadWatermark, Follow, Post, ReadStatus,
+                     UnreadCounter, UserStats)
+from .read_tracking import annotate_read_status, unread_posts
+from .signals import (fanout_resumed, follows_bulk_created,
+                      posts_bulk_created, read_status_changed)
+from .timeline import is_fanned_out
+
+
+def counted_follows(user):
+    """Подписки на авторов с раскладкой: только для них есть счетчики.
+
+    У авторов без раскладки слишком много подписчиков, чтобы обновлять
+    их счетчики при каждой публикации, поэтому число их непрочитанных
+    постов считается при чтении.
+    """
+    return Follow.objects.filter(user=user).exclude(
+        following__stats__fanned_out=False
+    )
+
+
+def merged_author_ids(user):
+    return Follow.objects.filter(
+        user=user, following__stats__fanned_out=False
+    ).values('following_id')
+
+
+def unread_count(user):
+    stored = UnreadCounter.objects.filter(
+        user=user, author_id__in=counted_follows(user).values('following_id')
+    ).aggregate(total=Coalesce(Sum('count'), 0))['total']
+    return stored + unread_posts(user).filter(
+        author_id__in=merged_author_ids(user)
+    ).count()
+
+
+def unread_by_author(user):
+    stored = UnreadCounter.objects.filter(
+        user=user,
+        author_id__in=counted_follows(user).values('following_id'),
+        count__gt=0
+    ).values_list('author__username', 'count')
+    merged = unread_posts(user).filter(
+        author_id__in=merged_author_ids(user)
+    ).order_by().values('author__username').annotate(
+        unread=Count('pk')
+    ).values_list('author__username', 'unread')
+    return sorted(
+        [*stored, *merged], key=lambda row: (-row[1], row[0])
+    )
+
+
+def count_unread(user, author_ids):
+    rows = unread_posts(user).filter(author_id__in=author_ids).order_by(
+    ).values('author_id').annotate(unread=Count('pk')).values_list(
+        'author_id', 'unread'
+    )
+    return dict(rows)
+
+
+def rebuild_counters(user):
+    author_ids = list(counted_follows(user).values_list(
+        'following_id', flat=True
+    ))
+    counts = count_unread(user, author_ids)
+    with transaction.atomic():
+        UnreadCounter.objects.filter(user=user).delete()
+        UnreadCounter.objects.bulk_create([
+            UnreadCounter(
+                user=user, author_id=author_id, count=counts.get(author_id, 0)
+            )
+            for author_id in author_ids
+        ])
+
+
+def decrement(user, post_ids):
+    read_posts = Post.objects.filter(pk__in=post_ids)
+    read_by_author = read_posts.filter(
+        author_id=OuterRef('author_id')
+    ).order_by().values('author_id').annotate(read=Count('pk')).values('read')
+    UnreadCounter.objects.filter(
+        user=user, author_id__in=read_posts.values('author_id')
+    ).update(count=Greatest(F('count') - Subquery(read_by_author), Value(0)))
+
+
+@receiver(read_status_changed, sender=ReadStatus)
+def read_status_changed_handler(sender, user, post_ids, **kwargs):
+    if post_ids is None:
+        rebuild_counters(user)
+    else:
+        decrement(user, post_ids)
+
+
+def rebuild_author_counters(author_id):
+    """Пересчитывает счетчики всех подписчиков автора одним запросом."""
+    unread = annotate_read_status(
+        OuterRef(OuterRef('user_id')),
+        Post.objects.filter(author_id=author_id)
+    ).filter(read_status=False).order_by().values('author_id').annotate(
+        unread=Count('pk')
+    ).values('unread')
+    counts = Follow.objects.filter(following_id=author_id).annotate(
+        unread=Coalesce(Subquery(unread), 0)
+    ).values_list('user_id', 'unread')
+    with transaction.atomic():
+        UnreadCounter.objects.filter(author_id=author_id).delete()
+        UnreadCounter.objects.bulk_create([
+            UnreadCounter(user_id=user_id, author_id=author_id, count=count)
+            for user_id, count in counts
+        ])
+
+
+@receiver(post_save, sender=Post)
+def post_created_handler(sender, instance, created, **kwargs):
+    if created and is_fanned_out(instance.author_id):
+        UnreadCounter.objects.filter(author_id=instance.author_id).update(
+            count=F('count') + 1
+        )
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleted_handler(sender, instance, **kwargs):
+    marks = ReadStatus.objects.filter(post=instance)
+    read_by = marks.filter(read=True).values('user_id')
+    unread_by = marks.filter(read=False).values('user_id')
+    covered_by = AuthorReadWatermark.objects.filter(
+        author_id=instance.author_id, watermark__gte=instance.pk
+    ).values('user_id')
+    UnreadCounter.objects.filter(
+        author_id=instance.author_id, count__gt=0
+    ).exclude(user_id__in=read_by).exclude(
+        (
+            Q(user__read_watermark__watermark__gte=instance.pk)
+            | Q(user_id__in=covered_by)
+        )
+        & ~Q(user_id__in=unread_by)
+    ).update(count=F('count') - 1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created_handler(sender, instance, created, **kwargs):
+    if not created or not is_fanned_out(instance.following_id):
+        return
+    counts = count_unread(instance.user_id, [instance.following_id])
+    UnreadCounter.objects.update_or_create(
+        user_id=instance.user_id,
+        author_id=instance.following_id,
+        defaults={'count': counts.get(instance.following_id, 0)},
+    )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted_handler(sender, instance, **kwargs):
+    UnreadCounter.objects.filter(
+        user_id=instance.user_id, author_id=instance.following_id
+    ).delete()
+
+
+@receiver(posts_bulk_created, sender=Post)
+def posts_bulk_created_handler(sender, author_id, posts, **kwargs):
+    if is_fanned_out(author_id):
+        UnreadCounter.objects.filter(author_id=author_id).update(
+            count=F('count') + len(posts)
+        )
+
+
+@receiver(fanout_resumed, sender=UserStats)
+def fanout_resumed_handler(sender, author_id, **kwargs):
+    rebuild_author_counters(author_id)
+
+
+@receiver(follows_bulk_created, sender=Follow)
+def follows_bulk_created_handler(sender, user_id, following_ids, **kwargs):
+    following_ids = list(counted_follows(user_id).filter(
+        following_id__in=following_ids
+    ).values_list('following_id', flat=True))
+    counts = count_unread(user_id, following_ids)
+    UnreadCounter.objects.filter(
+        user_id=user_id, author_id__in=following_ids
+    ).delete()
+    UnreadCounter.objects.bulk_create([
+        UnreadCounter(
+            user_id=user_id, author_id=author_id,
+            count=counts.get(author_id, 0)
+        )
+        for author_id in following_ids
+    ])
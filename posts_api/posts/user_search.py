@@ -0,0 +1,134 @@
+import bisect
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import User
+
+# Больше номеров в pk__in не передаются: SQLite ограничивает число
+# параметров запроса, а длинный IN медленнее проверки префикса базой.
+PREFIX_CANDIDATES = getattr(settings, 'USERNAME_PREFIX_CANDIDATES', 500)
+
+
+class DatabaseUsernameIndex:
+    """Поиск имен средствами базы.
+
+    В PostgreSQL подстроки ищутся по триграммному GIN-индексу на
+    UPPER(username), префиксы по btree-индексу с text_pattern_ops.
+    """
+
+    def search(self, query):
+        return User.objects.filter(username__icontains=query).values('pk')
+
+    def prefix(self, query):
+        return User.objects.filter(username__istartswith=query).values('pk')
+
+    def prefix_filter(self, query):
+        return Q(username__istartswith=query)
+
+    def add(self, user):
+        pass
+
+    def remove(self, user):
+        pass
+
+
+class PrefixUsernameIndex:
+    """Отсортированный список имен в памяти процесса.
+
+    Префикс ищется бинарным поиском, подстрока проходом по списку.
+    Индекс строится при первом обращении и обновляется сигналами
+    пользователей, поэтому подходит для одного процесса (SQLite, тесты).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = None
+        self.names = {}
+
+    def load(self):
+        if self.entries is None:
+            self.names = {
+                pk: username.casefold()
+                for pk, username in User.objects.values_list('pk', 'username')
+            }
+            self.entries = sorted(
+                (name, pk) for pk, name in self.names.items()
+            )
+        return self.entries
+
+    def search(self, query):
+        query = query.casefold()
+        with self.lock:
+            return [pk for name, pk in self.load() if query in name]
+
+    def prefix(self, query, limit=None):
+        query = query.casefold()
+        ids = []
+        with self.lock:
+            entries = self.load()
+            position = bisect.bisect_left(entries, (query, ))
+            while (
+                position < len(entries)
+                and entries[position][0].startswith(query)
+                and (limit is None or len(ids) < limit)
+            ):
+                ids.append(entries[position][1])
+                position += 1
+        return ids
+
+    def prefix_filter(self, query):
+        """Условие на пользователей с именем, начинающимся с query.
+
+        Если совпадений больше PREFIX_CANDIDATES, префикс проверяет база.
+        """
+        ids = self.prefix(query, PREFIX_CANDIDATES + 1)
+        if len(ids) > PREFIX_CANDIDATES:
+            return Q(username__istartswith=query)
+        return Q(pk__in=ids)
+
+    def add(self, user):
+        with self.lock:
+            name = user.username.casefold()
+            if self.entries is None or self.names.get(user.pk) == name:
+                return
+            self.discard(user.pk)
+            self.names[user.pk] = name
+            bisect.insort(self.entries, (name, user.pk))
+
+    def remove(self, user):
+        with self.lock:
+            if self.entries is not None:
+                self.discard(user.pk)
+
+    def discard(self, pk):
+        name = self.names.pop(pk, None)
+        if name is not None:
+            del self.entries[bisect.bisect_left(self.entries, (name, pk))]
+
+
+def get_default_backend():
+    if connection.vendor == 'postgresql':
+        return 'posts.user_search.DatabaseUsernameIndex'
+    return 'posts.user_search.PrefixUsernameIndex'
+
+
+username_index = import_string(
+    getattr(settings, 'USERNAME_INDEX_BACKEND', None)
+    or get_default_backend()
+)()
+
+
+@receiver(post_save, sender=User)
+def user_saved_handler(sender, instance, **kwargs):
+    username_index.add(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted_handler(sender, instance, **kwargs):
+    username_index.remove(instance)
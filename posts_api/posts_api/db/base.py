@@ -0,0 +1,129 @@
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions, extras
+
+from .creation import DatabaseCreation
+from .pool import ConnectionPool, PoolTimeout
+
+Database = base.Database
+
+
+def new_connection(conn_params):
+    connection = Database.connect(**conn_params)
+    # Как в стандартном бэкенде: JSONField сам разбирает jsonb.
+    extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+def reset_connection(connection):
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с проверкой соединений и необязательным пулом.
+
+    При CONN_HEALTH_CHECKS постоянное соединение проверяется запросом
+    SELECT 1 перед первым использованием в каждом запросе, как в Django
+    4.1. С настройкой POOL соединения берутся из общего для потоков
+    процесса пула и возвращаются в него при закрытии.
+    """
+    creation_class = DatabaseCreation
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.pool = None
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        # Тесты и служебные курсоры меняют имя базы у того же псевдонима.
+        key = (self.alias, conn_params.get('database'))
+        with self.pools_lock:
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(
+                    lambda: new_connection(conn_params),
+                    check=(
+                        check_connection
+                        if self.settings_dict.get('CONN_HEALTH_CHECKS')
+                        else None
+                    ),
+                    reset=reset_connection,
+                    **options,
+                )
+            return self.pools[key]
+
+    def get_pool_stats(self):
+        with self.pools_lock:
+            return {
+                database: pool.get_stats()
+                for (alias, database), pool in self.pools.items()
+                if alias == self.alias
+            }
+
+    def close_pools(self):
+        """Закрывает и забывает пулы псевдонима."""
+        with self.pools_lock:
+            keys = [key for key in self.pools if key[0] == self.alias]
+            pools = [self.pools.pop(key) for key in keys]
+        for pool in pools:
+            pool.close_all()
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            connection = pool.acquire()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+        self.pool = pool
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        connection, self.connection = self.connection, None
+        self.pool.release(connection)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and not self.in_atomic_block
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
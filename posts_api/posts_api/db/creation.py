@@ -0,0 +1,16 @@
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Закрывает свободные соединения пула перед удалением и копированием
+    тестовой базы: PostgreSQL не даст это сделать при открытых
+    соединениях.
+    """
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.connection.close_pools()
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.connection.close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Пул соединений с базой внутри процесса.
+
+    Держит не меньше min_size и не больше max_size соединений. Свободные
+    соединения старше idle_timeout секунд закрываются, если их больше
+    min_size. Если все соединения заняты, acquire ждет до timeout секунд.
+    check вызывается для соединения перед выдачей, reset — при возврате;
+    соединение, не прошедшее их, закрывается.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, idle_timeout=300,
+                 timeout=30, check=None, reset=None):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.check = check
+        self.reset = reset
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.size = 0
+        self.closed = False
+        self.metrics = dict.fromkeys(
+            ('created', 'reused', 'discarded', 'expired', 'waits',
+             'timeouts'), 0
+        )
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = self.checkout(deadline)
+            if connection is None:
+                return self.create()
+            if self.check is None or self.is_healthy(connection):
+                self.count('reused')
+                return connection
+            self.discard(connection)
+
+    def checkout(self, deadline):
+        """Свободное соединение или None, если можно открыть новое."""
+        with self.condition:
+            waited = False
+            while True:
+                self.expire_idle()
+                if self.idle:
+                    connection, _ = self.idle.pop()
+                    return connection
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'Все {self.max_size} соединений пула заняты.'
+                    )
+                if not waited:
+                    self.metrics['waits'] += 1
+                    waited = True
+                self.condition.wait(remaining)
+
+    def create(self):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self.count('created')
+        return connection
+
+    def release(self, connection):
+        try:
+            usable = self.reset is None or self.reset(connection)
+        except Exception:
+            usable = False
+        with self.condition:
+            if usable and not self.closed:
+                self.idle.append((connection, time.monotonic()))
+                self.condition.notify()
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        self.close_connection(connection)
+        with self.condition:
+            self.size -= 1
+            self.metrics['discarded'] += 1
+            self.condition.notify()
+
+    def expire_idle(self):
+        # Вызывается под self.condition. Самые старые соединения лежат в
+        # начале очереди, выдаются последние возвращенные.
+        limit = time.monotonic() - self.idle_timeout
+        while (
+            self.idle
+            and self.size > self.min_size
+            and self.idle[0][1] < limit
+        ):
+            connection, _ = self.idle.popleft()
+            self.close_connection(connection)
+            self.size -= 1
+            self.metrics['expired'] += 1
+
+    def is_healthy(self, connection):
+        try:
+            return self.check(connection)
+        except Exception:
+            return False
+
+    def close_connection(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Закрывает свободные соединения, занятые закроются при возврате."""
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                connection, _ = self.idle.popleft()
+                self.close_connection(connection)
+                self.size -= 1
+
+    def count(self, metric):
+        with self.condition:
+            self.metrics[metric] += 1
+
+    def get_stats(self):
+        with self.condition:
+            return dict(
+                self.metrics,
+                size=self.size,
+                idle=len(self.idle),
+                in_use=self.size - len(self.idle),
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
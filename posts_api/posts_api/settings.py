@@ -17,6 +17,42 @@ PG_HOST = os.getenv('PG_HOST')
 
 PG_PORT = os.getenv('PG_PORT')
 
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE') or 60)
+
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', '1') in (
+    '1', 'true'
+)
+
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE') or 0)
+
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE') or 0)
+
+DB_POOL_IDLE_TIMEOUT = int(os.getenv('DB_POOL_IDLE_TIMEOUT') or 300)
+
+DB_REPLICA_HOSTS = [
+    host for host in (os.getenv('DB_REPLICA_HOSTS') or '').split(',') if host
+]
+
+CACHE_BACKEND = (
+    os.getenv('CACHE_BACKEND')
+    or 'django.core.cache.backends.locmem.LocMemCache'
+)
+
+CACHE_LOCATION = os.getenv('CACHE_LOCATION') or 'posts-api'
+
+CONDITIONAL_GET = {'1': True, 'true': True, '0': False, 'false': False}.get(
+    os.getenv('CONDITIONAL_GET')
+)
+
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS') or 32)
+
+READ_STATUS_WRITE_BEHIND = os.getenv('READ_STATUS_WRITE_BEHIND') in (
+    '1', 'true'
+)
+
+# Без токена /metrics закрыт.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 SECRET_KEY = DJANGO_SECRET_KEY
@@ -41,6 +77,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.asgi_urlconf_middleware',
+    'api.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +90,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'posts_api.urls'
 
+ASGI_URLCONF = 'posts_api.asgi_urls'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -72,12 +112,49 @@ WSGI_APPLICATION = 'posts_api.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'posts_api.db',
         'NAME': DB_NAME,
         'USER': PG_USER,
         'PASSWORD': PG_PASSWORD,
         'HOST': PG_HOST,
         'PORT': PG_PORT,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+    }
+}
+
+if DB_POOL_MAX_SIZE:
+    # Соединения переиспользует пул, а Django возвращает их в пул в конце
+    # каждого запроса.
+    DATABASES['default'].update(CONN_MAX_AGE=0, POOL={
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'idle_timeout': DB_POOL_IDLE_TIMEOUT,
+    })
+
+for number, host in enumerate(DB_REPLICA_HOSTS):
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'}
+    )
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = 5
+
+AUTH_USER_CACHE_SIZE = 10000
+
+AUTH_USER_CACHE_TIMEOUT = 30
+
+API_QUERY_BUDGET = 20
+
+API_SERVER_TIMING = DEBUG
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
     }
 }
 
@@ -115,7 +192,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -125,3 +211,42 @@ SIMPLE_JWT = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+TIMELINE_FANOUT_LIMIT = 1000
+
+TIMELINE_FANOUT_RESUME_LIMIT = 900
+
+POSTS_CACHE_ALIAS = 'default'
+
+POSTS_CACHE_TIMEOUT = 300
+
+# None — определить по бэкенду: LocMemCache не общий для процессов.
+POSTS_CACHE_SHARED = None
+
+# None — включить, если кэш общий, иначе предупредить при проверке;
+# True — не запускаться без общего кэша; False — выключить.
+POSTS_CONDITIONAL_GET = CONDITIONAL_GET
+
+POSTS_SEARCH_CONFIG = 'russian'
+
+USERNAME_INDEX_BACKEND = None
+
+USERNAME_PREFIX_CANDIDATES = 500
+
+POSTS_EXPORT_CHUNK_SIZE = 2000
+
+POSTS_BULK_LIMIT = 5000
+
+POSTS_STREAM_BACKEND = 'posts.pubsub.LocalBroker'
+
+POSTS_STREAM_TIMEOUT = 25
+
+POSTS_STREAM_DURATION = 300
+
+POSTS_SYNC_LIMIT = 500
+
+POSTS_SYNC_LAG = 2
+
+READ_STATUS_BUFFER_SIZE = 1000
+
+READ_STATUS_FLUSH_INTERVAL = 1